@@ -1,19 +1,43 @@
 # __init__.py
 import sys
-from aqt import mw
-from aqt.qt import QAction
-from aqt.utils import showInfo
-import os, re, html, hashlib
-from bs4 import BeautifulSoup
-import re
+from aqt import mw, gui_hooks
+from aqt.qt import QAction, QTimer
+from anki import hooks
+from aqt.utils import showInfo, tooltip, askUser
+from aqt.operations import QueryOp
+import os, re, html, hashlib, json, functools, time, contextlib, shutil, sqlite3, stat, unicodedata
+from collections import namedtuple
+from html.parser import HTMLParser
+from anki.utils import ids2str
 
 # === Configuration ===
 OUTPUT_DIR = os.path.expanduser("~/Downloads/Documents perso/Obsidian")
+USER_FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "user_files")  # Données de l'add-on hors du coffre (conservées par Anki lors des mises à jour)
 INDEX_NOTE_PATH = os.path.join(OUTPUT_DIR, "Anki.md")
+INDEX_PAGE_MAX_ENTRIES = 500      # Au-delà, Anki.md renvoie vers des pages par lettre (0 : une seule page)
+INDEX_PAGES_SUBDIR = "Index Anki" # Sous-dossier du coffre pour ces pages
+ID_INDEX_PATH = os.path.join(OUTPUT_DIR, ".anki_obsidian_index.json")  # Index anki_id -> fichier (caché pour Obsidian)
 ANKI_FIELD_NAME = "Texte"         # Nom du champ pour les notes "texte à trou"
 TITLE_MAX_LENGTH = 95             # Longueur max du titre extrait
+CLOZE_RENDER_MODE = "plain"       # Occlusions : "plain" (texte seul), "highlight" (<mark>texte</mark>) ou "footnote" (texte<sup>c1</sup>)
+TITLE_CACHE_SIZE = 4096           # Nombre de titres mémorisés entre deux syncs
 DECK_QUERY = "deck:*Fiches*"       # Requête pour cibler les decks
 NOTE_ID_TARGET = None             # Si vous voulez cibler une note spécifique
+EXPORT_MEDIA = True               # Copie les images et sons référencés dans le coffre et réécrit les liens
+MEDIA_SUBDIR = "attachments"      # Sous-dossier du coffre pour les médias (nommés par empreinte du contenu)
+MEDIA_HARDLINKS = True            # Lien physique vers collection.media si possible (sinon copie)
+VAULT_LAYOUT = "flat"             # Rangement des notes : "flat", "deck" (dossiers du paquet), "tag" (tag de premier niveau) ou "hash" (256 dossiers)
+RENAME_ON_TITLE_CHANGE = False    # Renomme le fichier d'une note quand son titre change (sinon l'ancien nom est gardé)
+INCREMENTAL_SYNC = True           # Ne réécrit que les notes modifiées depuis la dernière sync
+LIVE_EXPORT = False               # Exporte automatiquement les notes ajoutées/modifiées/supprimées
+LIVE_EXPORT_DELAY_MS = 3000       # Délai d'attente après la dernière modification avant l'export
+LOAD_BATCH_SIZE = 1000            # Nombre de notes chargées par requête SQL
+RENDER_BATCH_SIZE = 500           # Nombre de notes rendues par lot
+VERBOSITY = 1                     # 0 : erreurs seulement, 1 : résumé, 2 : détail par note, 3 : debug
+SYNC_REPORT_PATH = os.path.join(USER_FILES_DIR, "sync_report.json")  # Rapport JSON de la dernière sync (None pour désactiver)
+JOURNAL_PATH = os.path.join(USER_FILES_DIR, "sync_journal.jsonl")  # Journal de reprise des syncs interrompues (None pour désactiver)
+FTS_DB_PATH = None                # Base SQLite FTS5 de recherche plein texte, ex. os.path.join(OUTPUT_DIR, ".anki_obsidian_search.sqlite")
+JOURNAL_CHECKPOINT_SECONDS = 15   # Intervalle minimal entre deux points de reprise (sauvegarde de l'index)
 
 # Pour les notes recto-verso
 RECTO_VERSO_TYPES = {
@@ -26,6 +50,62 @@ RECTO_VERSO_TYPES = {
 tag_notes_set = set()
 top_level_tag_set = set()
 
+# Graphe des tags construit en mémoire pendant l'export :
+# nom de fichier du tag -> {"title": tag, "notes": {liens de notes}, "children": {fichiers des tags enfants}}
+tag_graph = {}
+
+# Note chargée en masse depuis la table "notes" ; model est l'entrée de notetype_cache
+# deck n'est renseigné qu'avec VAULT_LAYOUT = "deck" ou FTS_DB_PATH
+NoteRecord = namedtuple("NoteRecord", ["id", "mid", "mod", "tags", "fields", "model", "deck"], defaults=[None])
+notetype_cache = {}  # mid -> {"name", "field_names", "field_index"}
+deck_name_cache = {}  # did -> nom complet du paquet
+
+# Empreintes des fichiers générés hors notes (fiches de tag, Anki.md) : chemin relatif -> {"hash", "mtime"}
+file_hash_cache = {}
+
+# Mesures de la sync en cours : durée cumulée par phase et compteurs (fichiers, octets, notes)
+sync_stats = {"started": None, "timers": {}, "counters": {}}
+
+PROGRESS_EVERY = 25               # Fréquence (en notes) des mises à jour de la progression
+progress_enabled = True           # Désactivé pendant l'export en direct (pas de fenêtre de progression)
+sync_running = False
+
+# Export en direct : IDs en attente, regroupés par un minuteur relancé à chaque modification
+live_changed_ids = set()
+live_deleted_ids = set()
+live_timer = None
+
+# Connexion à la base de recherche FTS_DB_PATH pendant une sync (None si désactivée)
+search_db = None
+
+# Plan de la sync en mode aperçu : {"operations": {chemin relatif: opération}, "index": état final de l'index}.
+# Tant qu'il n'est pas None, les écritures, déplacements et suppressions du coffre sont notés au lieu d'être faits.
+sync_plan = None
+
+# Journal de la sync complète en cours : {"last_checkpoint"} (None hors sync ou si JOURNAL_PATH est None)
+sync_journal = None
+
+# Index persistant anki_id -> {"path", "hash", "mtime"}, chargé une fois par sync ; path est relatif
+# à OUTPUT_DIR, avec "/" comme séparateur (sous-dossiers selon VAULT_LAYOUT)
+ID_INDEX_VERSION = 1
+RENDER_FORMAT_VERSION = 3  # À incrémenter quand le rendu des notes change, pour tout re-rendre une fois
+ANKI_ID_PATTERN = re.compile(r"<!--\s*anki_id:\s*(\d+)\s*-->")
+id_index = {}
+
+# Médias exportés : nom dans collection.media -> {"size", "mtime", "target"} (sauvegardé avec l'index),
+# noms présents dans MEDIA_SUBDIR (listés une fois par sync) et médias déjà résolus pendant la sync
+MEDIA_REF_PATTERN = re.compile(r"""(<img\b[^>]*?\bsrc=)(?:"([^"]*)"|'([^']*)'|([^\s>]+))|\[sound:([^\]]+)\]""",
+                               re.IGNORECASE)
+media_manifest = {}
+attachment_files = None
+resolved_media = {}
+
+# Noms de fichiers déjà pris dans OUTPUT_DIR (en minuscules) et prochain suffixe par nom de base ;
+# listed_folders : dossiers (relatifs, "" pour la racine) dont le contenu est déjà dans taken_filenames
+taken_filenames = set()
+filename_counters = {}
+listed_folders = set()
+
 # === Fonctions utilitaires ===
 
 def setup_menu():
@@ -38,7 +118,7 @@ def setup_menu():
         action.setShortcut("Ctrl+O")
     action.triggered.connect(sync_to_obsidian)
     mw.form.menuTools.addAction(action)
-    print("Bouton 'Sync vers Obsidian' ajouté avec raccourci.")
+    log("Bouton 'Sync vers Obsidian' ajouté avec raccourci.")
 
 def sanitize_filename(title, max_length=100):
     """Nettoie une chaîne pour l'utiliser comme nom de fichier."""
@@ -51,205 +131,1318 @@ def sanitize_filename(title, max_length=100):
     return title[:max_length].strip()
 
 def get_field_by_name(note, field_name):
-    # note._model["flds"] contient la description des champs
+    # note.model["field_index"] associe chaque nom de champ à sa position
     # note.fields est la liste des valeurs dans l'ordre
-    model = note.model()
-    for index, fld in enumerate(model["flds"]):
-        if fld["name"] == field_name:
-            return note.fields[index]
-    return ""
-
+    index = note.model["field_index"].get(field_name)
+    if index is None or index >= len(note.fields):
+        return ""
+    return note.fields[index]
+
+class PlainTextParser(HTMLParser):
+    """Texte brut d'un fragment HTML (pour la recherche) : ignore <script>, <style> et <template>."""
+    SKIPPED_TAGS = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.skip_depth = 0
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth += 1
+        self.parts.append(" ")  # <div>a</div><div>b</div> donne "a b", pas "ab"
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        self.parts.append(" ")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+def html_to_text(html_content):
+    """Texte brut sur une ligne, espaces normalisés."""
+    parser = PlainTextParser()
+    parser.feed(html_content)
+    parser.close()
+    return " ".join("".join(parser.parts).split())
+
+class TitleFound(Exception):
+    """Interrompt FirstTextLineParser dès que la première ligne de texte est trouvée."""
+
+class FirstTextLineParser(HTMLParser):
+    """
+    Parcourt le HTML en flux et s'arrête au premier nœud texte non vide, sans construire d'arbre.
+    Comme BeautifulSoup.get_text(), ignore commentaires, <script>, <style> et <template>,
+    et fusionne le texte contigu (entités comprises) en un seul nœud.
+    """
+    SKIPPED_TAGS = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.skip_depth = 0
+        self.pending = []
+        self.first_line = None
+
+    def flush(self):
+        text = "".join(self.pending).strip()
+        self.pending = []
+        if text:
+            self.first_line = text.split("\n", 1)[0].strip()
+            raise TitleFound()
+
+    def handle_starttag(self, tag, attrs):
+        self.flush()
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth += 1
+
+    def handle_endtag(self, tag):
+        self.flush()
+        if tag in self.SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.flush()
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.pending.append(data)
+
+    def handle_comment(self, data):
+        self.flush()
+
+    def handle_decl(self, decl):
+        self.flush()
+
+    def handle_pi(self, data):
+        self.flush()
+
+    def unknown_decl(self, data):
+        self.flush()
+        if data.upper().startswith("CDATA["):
+            self.pending.append(data[len("CDATA["):])
+            self.flush()
+
+    def close(self):
+        super().close()
+        self.flush()
+
+@functools.lru_cache(maxsize=TITLE_CACHE_SIZE)
 def extract_title_from_html(html_content, max_len):
-    """Extrait la première ligne significative du HTML comme titre."""
+    """Extrait la première ligne significative du HTML comme titre (mémorisé par contenu)."""
     if not html_content:
         return "Sans titre"
+    parser = FirstTextLineParser()
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        text_content = soup.get_text(separator='\n', strip=True)
-        if not text_content:
-            return "Sans titre"
-        # Récupération de la première ligne non vide
-        for line in text_content.split('\n'):
-            stripped_line = line.strip()
-            if stripped_line:
-                title = html.unescape(stripped_line)
-                return title if len(title) <= max_len else title[:max_len] + "..."
-        return "Sans titre"
+        parser.feed(html_content)
+        parser.close()
+    except TitleFound:
+        pass
     except Exception as e:
-        print(f"Erreur lors de l'extraction du titre: {e}")
+        log(f"Erreur lors de l'extraction du titre: {e}", 0)
         return "Sans titre"
+    if not parser.first_line:
+        return "Sans titre"
+    title = html.unescape(parser.first_line)
+    return title if len(title) <= max_len else title[:max_len] + "..."
+
+CLOZE_TOKEN_PATTERN = re.compile(r"\{\{c(\d+)::|::|\}\}|\u00A0")
+
+def render_clozes(text, mode="plain"):
+    """
+    Parcourt le texte une seule fois pour retirer les occlusions Anki, y compris imbriquées
+    ({{c1::a {{c2::b}} c}}) et avec indice ({{c1::réponse::indice}}), et remplace les espaces
+    insécables par des espaces. mode : "plain" (contenu seul), "highlight" (<mark>contenu</mark>)
+    ou "footnote" (contenu<sup>cN</sup>, avec les indices dans une liste <dl> à la fin) ; seules
+    les occlusions les plus externes sont décorées. Les champs restent du HTML brut, où Obsidian
+    n'interprète pas le Markdown (==...==, [^1]) : la décoration est donc en HTML. Une occlusion non fermée est laissée telle quelle.
+    """
+    # Pile des occlusions ouvertes : [numéro, morceaux du contenu, morceaux de l'indice ou None]
+    stack = []
+    out = []
+    footnotes = {}
+    pos = 0
+
+    def current():
+        """Morceaux en cours d'écriture : texte hors occlusion, contenu ou indice de l'occlusion ouverte."""
+        if not stack:
+            return out
+        return stack[-1][2] if stack[-1][2] is not None else stack[-1][1]
+
+    for match in CLOZE_TOKEN_PATTERN.finditer(text):
+        target = current()
+        target.append(text[pos:match.start()])
+        pos = match.end()
+        token = match.group()
+        if token == "\u00A0":
+            target.append(" ")
+        elif match.group(1):
+            stack.append([match.group(1), [], None])
+        elif not stack:
+            target.append(token)
+        elif token == "::":
+            if stack[-1][2] is None:
+                stack[-1][2] = []
+            else:
+                target.append(token)
+        else:
+            number, content, hint = stack.pop()
+            content = "".join(content)
+            # Seule l'occlusion la plus externe est décorée (pas de surlignage imbriqué)
+            if not stack and mode == "highlight":
+                content = f"<mark>{content}</mark>"
+            elif not stack and mode == "footnote":
+                hints = footnotes.setdefault(number, [])
+                if hint and "".join(hint) not in hints:
+                    hints.append("".join(hint))
+                content = f"{content}<sup>c{number}</sup>"
+            current().append(content)
+    current().append(text[pos:])
+
+    # Occlusions jamais fermées : on restitue le texte d'origine, de la plus interne à la plus externe
+    while stack:
+        number, content, hint = stack.pop()
+        literal = "{{c" + number + "::" + "".join(content) + ("::" + "".join(hint) if hint is not None else "")
+        current().append(literal)
+
+    result = "".join(out)
+    if footnotes:
+        definitions = [f"<dt>c{n}</dt><dd>" + (" / ".join(footnotes[n]) or f"c{n}") + "</dd>"
+                       for n in sorted(footnotes, key=int)]
+        result += "\n\n<dl>" + "".join(definitions) + "</dl>"
+    return result
 
 def remove_cloze_keep_html(text):
     """Supprime les marqueurs d'occlusion Anki en gardant le contenu, et remplace les &nbsp; par des espaces."""
-    text = text.replace('\u00A0', ' ')
-    return re.sub(r"{{c\d+::(.*?)(::.*?)?}}", r"\1", text, flags=re.DOTALL)
+    return render_clozes(text)
+
+# === Journalisation et mesures ===
+
+def log(message, level=1):
+    """Affiche le message si son niveau ne dépasse pas VERBOSITY (0 : erreur, 2 : par note, 3 : debug)."""
+    if level <= VERBOSITY:
+        print(message)
+
+def reset_sync_stats():
+    sync_stats["started"] = time.time()
+    sync_stats["timers"] = {}
+    sync_stats["counters"] = {}
+
+def count(name, amount=1):
+    counters = sync_stats["counters"]
+    counters[name] = counters.get(name, 0) + amount
+
+def add_time(phase, seconds):
+    timers = sync_stats["timers"]
+    timers[phase] = timers.get(phase, 0.0) + seconds
+
+@contextlib.contextmanager
+def timed(phase):
+    """Ajoute la durée du bloc (ou de la fonction décorée) au minuteur de la phase."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(phase, time.perf_counter() - start)
+
+def write_sync_report(kind):
+    """
+    Affiche le résumé par phase et écrit le rapport JSON de la sync dans SYNC_REPORT_PATH
+    (hors du coffre : une sync sans changement ne touche aucun fichier du coffre).
+    En mode aperçu, le résumé est seulement affiché.
+    """
+    started = sync_stats["started"] or time.time()
+    report = {
+        "kind": kind,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "duration": round(time.time() - started, 4),
+        "timers": {phase: round(seconds, 4) for phase, seconds in sync_stats["timers"].items()},
+        "counters": dict(sync_stats["counters"]),
+    }
+    log("Durées : " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in report["timers"].items()))
+    log("Compteurs : " + ", ".join(f"{name} {value}" for name, value in sorted(report["counters"].items())))
+    if SYNC_REPORT_PATH and sync_plan is None:
+        try:
+            os.makedirs(os.path.dirname(SYNC_REPORT_PATH), exist_ok=True)
+            write_file_if_changed(SYNC_REPORT_PATH, json.dumps(report, indent=2, ensure_ascii=False))
+        except Exception as e:
+            log(f"Erreur lors de l'écriture du rapport {SYNC_REPORT_PATH}: {e}", 0)
+
+# === Écriture des fichiers ===
+
+def write_file_if_changed(filepath, content, cached=None):
+    """
+    Écrit content dans filepath seulement s'il diffère de ce qui est déjà sur disque,
+    pour ne pas réveiller inutilement Obsidian et les clients de synchronisation.
+    cached est un dict {"hash", "mtime"} (entrée d'index) : si le mtime du fichier n'a pas
+    bougé, on compare les empreintes sans relire le fichier ; il est mis à jour après coup.
+    L'écriture passe par un fichier temporaire renommé, pour ne jamais laisser de fichier tronqué.
+    Retourne True si le fichier a été écrit.
+    En mode aperçu (sync_plan), l'écriture est seulement notée dans le plan ; les fichiers cachés
+    (index) n'en font pas partie.
+    """
+    planning = sync_plan is not None and not os.path.basename(filepath).startswith(".")
+    # En aperçu, un fichier dont le déplacement est prévu est encore à son ancien emplacement
+    disk_path = planned_source(filepath) if planning else filepath
+    data = content.encode("utf-8")
+    new_hash = hashlib.md5(data).hexdigest()
+    try:
+        mtime = os.path.getmtime(disk_path)
+    except OSError:
+        mtime = None
+    if mtime is not None:
+        if cached and cached.get("mtime") == mtime and cached.get("hash"):
+            unchanged = cached["hash"] == new_hash
+        else:
+            with open(disk_path, "r", encoding="utf-8") as f:
+                existing = f.read()
+            count("files_read")
+            count("bytes_read", len(existing))
+            unchanged = existing == content
+        if unchanged:
+            count("files_skipped")
+            if cached is not None:
+                cached["hash"], cached["mtime"] = new_hash, mtime
+            return False
+
+    if planning:
+        plan_operation(filepath, "update" if mtime is not None else "create", content=content)
+        if cached is not None:
+            cached["hash"], cached["mtime"] = new_hash, None
+        return True
+
+    directory, filename = os.path.split(filepath)
+    tmp_path = os.path.join(directory, f".{filename}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    count("files_written")
+    count("bytes_written", len(data))
+    if cached is not None:
+        cached["hash"], cached["mtime"] = new_hash, os.path.getmtime(filepath)
+    return True
+
+def plan_operation(filepath, op, content=None, source=None, media=None):
+    """
+    Note une opération du plan (create, update, rename, delete) pour un fichier du coffre.
+    Un fichier déplacé puis réécrit reste un "rename" (avec son nouveau contenu) ; un fichier
+    créé puis supprimé dans la même sync disparaît du plan.
+    """
+    path = os.path.relpath(filepath, OUTPUT_DIR).replace(os.sep, "/")
+    operations = sync_plan["operations"]
+    previous = operations.get(path)
+    if previous and op in ("create", "update") and previous["op"] in ("create", "rename"):
+        previous["content"] = content
+        return
+    if previous and op == "delete" and previous["op"] == "create":
+        del operations[path]
+        return
+    operation = {"op": op}
+    if content is not None:
+        operation["content"] = content
+    if source is not None:
+        operation["source"] = source
+    if media is not None:
+        operation["media"] = media
+    operations[path] = operation
+
+def planned_source(filepath):
+    """Emplacement actuel d'un fichier dont le déplacement est prévu par le plan (sinon filepath)."""
+    path = os.path.relpath(filepath, OUTPUT_DIR).replace(os.sep, "/")
+    operation = sync_plan["operations"].get(path)
+    if operation and operation["op"] == "rename":
+        return os.path.join(OUTPUT_DIR, operation["source"])
+    return filepath
+
+def write_chunks_if_changed(filepath, make_chunks):
+    """
+    Variante de write_file_if_changed pour les gros fichiers produits morceau par morceau :
+    make_chunks() est appelé une fois pour l'empreinte, puis une seconde fois seulement s'il
+    faut écrire. Le contenu complet n'est jamais en mémoire. Retourne True si le fichier a été écrit.
+    """
+    new_hash = hashlib.md5()
+    for chunk in make_chunks():
+        new_hash.update(chunk.encode("utf-8"))
+    try:
+        existing_hash = hashlib.md5()
+        with open(filepath, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                existing_hash.update(block)
+                count("bytes_read", len(block))
+        count("files_read")
+        if existing_hash.digest() == new_hash.digest():
+            count("files_skipped")
+            return False
+    except FileNotFoundError:
+        pass
+
+    directory, filename = os.path.split(filepath)
+    tmp_path = os.path.join(directory, f".{filename}.tmp")
+    size = 0
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for chunk in make_chunks():
+                size += f.write(chunk)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    count("files_written")
+    count("bytes_written", size)
+    return True
+
+def write_generated_file(filename, content):
+    """Écrit une fiche générée (tag, index) dans OUTPUT_DIR en s'appuyant sur file_hash_cache."""
+    return write_file_if_changed(os.path.join(OUTPUT_DIR, filename), content,
+                                 cached=file_hash_cache.setdefault(filename, {}))
+
+# === Progression et annulation ===
+
+class SyncCancelled(Exception):
+    """Levée quand l'utilisateur annule la sync depuis la fenêtre de progression."""
+
+def report_progress(label, value=None, maximum=None):
+    """
+    Met à jour la fenêtre de progression d'Anki depuis le thread de travail,
+    puis lève SyncCancelled si l'utilisateur a demandé l'annulation.
+    """
+    if not progress_enabled:
+        return
+    mw.taskman.run_on_main(lambda: mw.progress.update(label=label, value=value, max=maximum))
+    if mw.progress.want_cancel():
+        raise SyncCancelled()
 
 # === Accès aux notes via l'API Anki ===
 
 def get_note_ids():
     """Retourne les IDs des notes correspondant à DECK_QUERY."""
     if NOTE_ID_TARGET:
-        print(f"Ciblage de la note unique ID : {NOTE_ID_TARGET}")
+        log(f"Ciblage de la note unique ID : {NOTE_ID_TARGET}")
         return [NOTE_ID_TARGET]
-    print(f"Recherche des notes avec la requête '{DECK_QUERY}'...")
+    log(f"Recherche des notes avec la requête '{DECK_QUERY}'...")
     note_ids = mw.col.findNotes(DECK_QUERY)
-    print(f"{len(note_ids)} note(s) trouvée(s).")
+    log(f"{len(note_ids)} note(s) trouvée(s).")
     return note_ids
 
-def get_notes_details(note_ids):
-    """Retourne les objets note pour les IDs donnés."""
-    notes = []
-    for nid in note_ids:
-        note = mw.col.getNote(nid)
-        if note:
-            notes.append(note)
-    print(f"Détails récupérés pour {len(notes)} note(s).")
-    return notes
+def get_notetype_info(mid):
+    """Résout une seule fois par type de note son nom et la position de ses champs."""
+    info = notetype_cache.get(mid)
+    if info is None:
+        model = mw.col.models.get(mid) or {}
+        field_names = [fld["name"] for fld in model.get("flds", [])]
+        info = {
+            "name": model.get("name", ""),
+            "field_names": field_names,
+            "field_index": {name: index for index, name in enumerate(field_names)},
+        }
+        notetype_cache[mid] = info
+    return info
+
+def get_note_decks(note_ids):
+    """Nom du paquet de la première carte de chaque note (paquet d'origine si la carte est dans un paquet filtré)."""
+    deck_ids = {}
+    for nid, did, odid in mw.col.db.all(f"select nid, did, odid from cards where nid in {ids2str(note_ids)} order by ord"):
+        deck_ids.setdefault(nid, odid or did)
+    decks = {}
+    for nid, did in deck_ids.items():
+        if did not in deck_name_cache:
+            deck_name_cache[did] = mw.col.decks.name(did)
+        decks[nid] = deck_name_cache[did]
+    return decks
 
-def find_existing_file_by_id(anki_id):
-    for filename in os.listdir(OUTPUT_DIR):
-        if filename.endswith(".md"):
-            filepath = os.path.join(OUTPUT_DIR, filename)
+def get_notes_details(note_ids):
+    """
+    Charge les notes pour les IDs donnés par lots de LOAD_BATCH_SIZE (une requête SQL par lot
+    sur la table "notes") et produit des NoteRecord légers, dans l'ordre de note_ids.
+    Seul le lot en cours est en mémoire : la mémoire reste bornée quelle que soit la collection.
+    """
+    notetype_cache.clear()
+    deck_name_cache.clear()
+    report_progress(f"Chargement de {len(note_ids)} note(s)...")
+    loaded = 0
+    for start in range(0, len(note_ids), LOAD_BATCH_SIZE):
+        batch = note_ids[start:start + LOAD_BATCH_SIZE]
+        with timed("load"):
+            rows = mw.col.db.all(f"select id, mid, mod, tags, flds from notes where id in {ids2str(batch)}")
+            decks = get_note_decks(batch) if VAULT_LAYOUT == "deck" or FTS_DB_PATH else {}
+        rows_by_id = {row[0]: row for row in rows}
+        loaded += len(rows_by_id)
+        for nid in batch:
+            row = rows_by_id.get(nid)
+            if row is None:
+                continue
+            nid, mid, mod, tags, flds = row
+            yield NoteRecord(nid, mid, mod, tags.split(), flds.split("\x1f"), get_notetype_info(mid), decks.get(nid))
+    log(f"Détails récupérés pour {loaded} note(s).")
+
+# === Index persistant anki_id -> fichier ===
+
+def read_anki_id(filepath):
+    """Retourne l'anki_id porté par la première ligne du fichier, ou None."""
+    with open(filepath, encoding="utf-8") as f:
+        first_line = f.readline()
+    count("files_read")
+    count("bytes_read", len(first_line))
+    match = ANKI_ID_PATTERN.search(first_line)
+    return match.group(1) if match else None
+
+def rebuild_id_index():
+    """
+    Reconstruit l'index en parcourant une seule fois les fichiers .md de OUTPUT_DIR et de ses
+    sous-dossiers (hors dossiers cachés et MEDIA_SUBDIR). Seule la première ligne est lue :
+    c'est là que l'export place le commentaire caché <!-- anki_id: X -->.
+    """
+    index = {}
+    for root, dirs, filenames in os.walk(OUTPUT_DIR):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and not (root == OUTPUT_DIR and d == MEDIA_SUBDIR)]
+        for filename in filenames:
+            if not filename.endswith(".md"):
+                continue
+            filepath = os.path.join(root, filename)
             try:
-                with open(filepath, encoding="utf-8") as f:
-                    content = f.read()
-                    if f"<!-- anki_id: {anki_id} -->" in content:
-                        return filename  # On retourne le nom du fichier existant
+                match = read_anki_id(filepath)
+                if match:
+                    index[match] = {
+                        "path": os.path.relpath(filepath, OUTPUT_DIR).replace(os.sep, "/"),
+                        "hash": None,  # Inconnu tant que le fichier n'a pas été relu ou réécrit
+                        "mtime": os.path.getmtime(filepath),
+                    }
             except Exception as e:
-                print(f"Erreur lors de la lecture de {filepath} : {e}")
-                continue
-    return None
+                log(f"Erreur lors de la lecture de {filepath} : {e}", 0)
+    log(f"Index des IDs reconstruit : {len(index)} fichier(s) référencé(s).")
+    return index
 
-# === Fonction d'export vers Obsidian ===
+def get_render_key():
+    """
+    Empreinte des réglages qui influencent le rendu ou le nom des fichiers : si elle change, tout
+    est re-rendu (activer RENAME_ON_TITLE_CHANGE renomme ainsi aussi les notes non modifiées).
+    """
+    settings = [RENDER_FORMAT_VERSION, ANKI_FIELD_NAME, TITLE_MAX_LENGTH, sorted(RECTO_VERSO_TYPES), CLOZE_RENDER_MODE,
+                EXPORT_MEDIA and MEDIA_SUBDIR, RENAME_ON_TITLE_CHANGE]
+    return hashlib.md5(json.dumps(settings).encode("utf-8")).hexdigest()
+
+@timed("index")
+def load_id_index():
+    """Charge l'index depuis ID_INDEX_PATH, ou le reconstruit s'il est absent ou corrompu."""
+    global attachment_files
+    id_index.clear()
+    file_hash_cache.clear()
+    media_manifest.clear()
+    resolved_media.clear()
+    attachment_files = None
+    try:
+        with open(ID_INDEX_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+        count("files_read")
+        if data.get("version") != ID_INDEX_VERSION or not isinstance(data.get("notes"), dict):
+            raise ValueError("format inattendu")
+        id_index.update(data["notes"])
+        file_hash_cache.update(data.get("files") or {})
+        media_manifest.update(data.get("media") or {})
+        if data.get("render_key") != get_render_key():
+            # Réglages de rendu modifiés : on oublie les "mod" pour forcer un rendu complet
+            for entry in id_index.values():
+                entry.pop("mod", None)
+        log(f"Index des IDs chargé : {len(id_index)} entrée(s).")
+    except FileNotFoundError:
+        log("Index des IDs absent, reconstruction...")
+        id_index.update(rebuild_id_index())
+    except (ValueError, OSError, AttributeError) as e:
+        log(f"Index des IDs illisible ({e}), reconstruction...")
+        id_index.update(rebuild_id_index())
+
+def iter_id_index_chunks():
+    """
+    Encode l'index en JSON entrée par entrée (encodeur C de json), pour que la sauvegarde
+    n'ait jamais à construire la chaîne complète, qui grandit avec la collection.
+    """
+    header = {"version": ID_INDEX_VERSION, "render_key": get_render_key(), "files": file_hash_cache,
+              "media": media_manifest}
+    yield json.dumps(header, ensure_ascii=False)[:-1] + ', "notes": {'
+    separator = ""
+    for key, entry in id_index.items():
+        yield f"{separator}{json.dumps(key)}: {json.dumps(entry, ensure_ascii=False)}"
+        separator = ", "
+    yield "}}"
+
+@timed("index")
+def save_id_index():
+    """Écrit l'index sur disque (appelé une fois en fin de sync ; jamais en mode aperçu)."""
+    if sync_plan is not None:
+        return
+    try:
+        write_chunks_if_changed(ID_INDEX_PATH, iter_id_index_chunks)
+    except Exception as e:
+        log(f"Erreur lors de l'écriture de l'index des IDs {ID_INDEX_PATH}: {e}", 0)
+
+def record_in_id_index(anki_id, filename, content, mod=None, tags=None):
+    """
+    Met à jour l'entrée de l'index après l'écriture du fichier de la note. En aperçu, le mtime
+    d'un fichier dont l'écriture ou le déplacement est prévu reste None (apply_sync_plan le
+    renseigne) ; celui d'un fichier inchangé est le mtime réel, pour que la sync suivante le saute.
+    """
+    filepath = os.path.join(OUTPUT_DIR, filename)
+    planned = sync_plan is not None and filename in sync_plan["operations"]
+    id_index[str(anki_id)] = {
+        "path": filename,
+        "hash": hashlib.md5(content.encode("utf-8")).hexdigest(),
+        "mtime": None if planned else os.path.getmtime(filepath),
+        "mod": mod,
+        "tags": list(tags or []),
+    }
+
+def load_missing_index_tags():
+    """
+    Complète les entrées de l'index sans tags (index reconstruit par rebuild_id_index) avec une
+    requête sur la table "notes" par lot de LOAD_BATCH_SIZE. Retourne les IDs des entrées dont
+    la note n'existe plus dans Anki (à supprimer comme des notes effacées).
+    """
+    missing = [int(key) for key, entry in id_index.items() if "tags" not in entry]
+    gone_ids = set(missing)
+    for start in range(0, len(missing), LOAD_BATCH_SIZE):
+        batch = missing[start:start + LOAD_BATCH_SIZE]
+        with timed("load"):
+            rows = mw.col.db.all(f"select id, tags from notes where id in {ids2str(batch)}")
+        for nid, tags in rows:
+            id_index[str(nid)]["tags"] = tags.split()
+            gone_ids.discard(nid)
+    if missing:
+        log(f"Tags chargés depuis Anki pour {len(missing) - len(gone_ids)} entrée(s) de l'index.", 2)
+    return gone_ids
+
+def is_note_unchanged(anki_id, mod):
+    """
+    Vrai si la note n'a pas été modifiée dans Anki depuis la dernière sync
+    et que son fichier n'a pas été touché depuis (même mtime).
+    """
+    entry = id_index.get(str(anki_id))
+    if not entry or mod is None or entry.get("mod") != mod:
+        return False
+    try:
+        return os.path.getmtime(os.path.join(OUTPUT_DIR, entry["path"])) == entry.get("mtime")
+    except OSError:
+        return False
 
-def export_notes(notes):
-    if not notes:
-        print("Aucune note à exporter.")
+def find_existing_file_by_id(anki_id):
+    """
+    Retourne le nom du fichier (.md) qui porte déjà cet ID, d'après l'index.
+    Un simple stat suffit tant que le mtime n'a pas bougé ; sinon on relit le fichier
+    pour vérifier qu'il contient toujours le commentaire caché.
+    """
+    key = str(anki_id)
+    entry = id_index.get(key)
+    if not entry:
+        return None
+    filepath = os.path.join(OUTPUT_DIR, entry["path"])
+    try:
+        mtime = os.path.getmtime(filepath)
+    except OSError:
+        # Fichier supprimé ou déplacé depuis la dernière sync
+        del id_index[key]
+        return None
+    if mtime != entry.get("mtime"):
+        try:
+            with open(filepath, encoding="utf-8") as f:
+                content = f.read()
+            count("files_read")
+            count("bytes_read", len(content))
+        except Exception as e:
+            log(f"Erreur lors de la lecture de {filepath} : {e}", 0)
+            return None
+        if f"<!-- anki_id: {anki_id} -->" not in content:
+            del id_index[key]
+            return None
+        entry["mtime"] = mtime
+        entry["hash"] = hashlib.md5(content.encode("utf-8")).hexdigest()
+    return entry["path"]
+
+def remove_exported_note(anki_id):
+    """
+    Supprime le fichier d'une note exportée et son entrée dans l'index.
+    Par sécurité, le fichier n'est supprimé que si sa première ligne porte bien cet ID.
+    """
+    entry = id_index.pop(str(anki_id), None)
+    if not entry:
+        return
+    remove_search_entry(anki_id)
+    filepath = os.path.join(OUTPUT_DIR, entry["path"])
+    try:
+        if read_anki_id(filepath) != str(anki_id):
+            log(f"Fichier {filepath} conservé (il ne porte plus l'ID {anki_id}).", 2)
+            return
+        if sync_plan is not None:
+            plan_operation(filepath, "delete")
+            taken_filenames.discard(os.path.basename(entry["path"]).lower())
+            return
+        os.remove(filepath)
+        taken_filenames.discard(os.path.basename(entry["path"]).lower())
+        remove_empty_folders(entry["path"])
+        count("files_deleted")
+        log(f"Fichier supprimé {filepath} (ID {anki_id} introuvable).", 2)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        log(f"Erreur lors de la suppression de {filepath} : {e}", 0)
+
+def seed_filename_allocator():
+    """
+    Initialise les noms pris à partir du listing de la racine et de l'index, pour ne plus
+    faire de os.path.exists par candidat. Comparaison insensible à la casse (macOS, Windows).
+    Les noms des notes exportées sont uniques dans tout le coffre (liens [[Titre]] non ambigus) ;
+    les fichiers personnels des sous-dossiers sont ajoutés par list_folder_names(), un listing
+    par dossier de destination.
+    """
+    taken_filenames.clear()
+    filename_counters.clear()
+    listed_folders.clear()
+    list_folder_names("")
+    taken_filenames.update(os.path.basename(entry["path"]).lower() for entry in id_index.values())
+
+def list_folder_names(folder):
+    """Ajoute aux noms pris le contenu réel du dossier (relatif à OUTPUT_DIR), listé une seule fois par sync."""
+    if folder in listed_folders:
         return
+    listed_folders.add(folder)
+    path = os.path.join(OUTPUT_DIR, folder) if folder else OUTPUT_DIR
+    try:
+        taken_filenames.update(name.lower() for name in os.listdir(path))
+    except FileNotFoundError:
+        pass  # Dossier pas encore créé (ou coffre absent lors de l'aperçu d'une première sync)
+    except OSError as e:
+        log(f"Erreur lors de la lecture du dossier {path} : {e}", 0)
 
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+def is_free_for_note(filepath, anki_id):
+    """
+    Vrai si filepath n'existe pas ou porte déjà l'anki_id de cette note : un fichier qui n'est
+    pas à elle (note personnelle, autre note) n'est jamais écrasé ni remplacé.
+    """
+    try:
+        return read_anki_id(filepath) == str(anki_id)
+    except FileNotFoundError:
+        return True
+    except (OSError, UnicodeDecodeError):
+        return False
+
+def allocate_filename(base_filename):
+    """
+    Réserve un nom libre pour une nouvelle note : base_filename, sinon base_filename_1, _2...
+    Le compteur par nom de base évite de retester les suffixes déjà attribués.
+    """
+    key = base_filename.lower()
+    if f"{key}.md" not in taken_filenames:
+        taken_filenames.add(f"{key}.md")
+        return base_filename
+    suffix = filename_counters.get(key, 1)
+    while f"{key}_{suffix}.md" in taken_filenames:
+        suffix += 1
+    filename_counters[key] = suffix + 1
+    taken_filenames.add(f"{key}_{suffix}.md")
+    return f"{base_filename}_{suffix}"
+
+def choose_note_stem(anki_id, old_path, base_filename):
+    """
+    Nom (sans .md) d'une note déjà exportée. Si RENAME_ON_TITLE_CHANGE est actif et que le titre
+    a changé, un nouveau nom est réservé (le fichier est déplacé ensuite par move_exported_note).
+    Le nom courant est gardé tant qu'il dérive déjà du titre (base ou base_N).
+    Les liens des fiches de tag suivent d'eux-mêmes, puisqu'elles sont régénérées depuis le graphe
+    et réécrites seulement si elles changent.
+    """
+    old_stem = note_stem(old_path)
+    if not RENAME_ON_TITLE_CHANGE or re.fullmatch(re.escape(base_filename.lower()) + r"(_\d+)?", old_stem.lower()):
+        return old_stem
+    # On libère l'ancien nom d'abord : un simple changement de casse garde le même nom de base
+    taken_filenames.discard(os.path.basename(old_path).lower())
+    count("files_renamed")
+    return allocate_filename(base_filename)
+
+def note_stem(path):
+    """Nom de la note tel qu'utilisé dans les liens [[...]] : nom du fichier sans dossier ni .md."""
+    return os.path.basename(path)[:-3]
+
+def get_note_folder(note):
+    """Sous-dossier (relatif à OUTPUT_DIR, séparé par "/") où ranger la note selon VAULT_LAYOUT."""
+    if VAULT_LAYOUT == "deck" and note.deck:
+        return "/".join(sanitize_filename(part) for part in note.deck.split("::"))
+    if VAULT_LAYOUT == "tag":
+        return sanitize_filename(note.tags[0].split("::")[0]) if note.tags else "Sans tag"
+    if VAULT_LAYOUT == "hash":
+        return hashlib.md5(str(note.id).encode("utf-8")).hexdigest()[:2]
+    return ""
+
+def move_exported_note(anki_id, new_path):
+    """
+    Déplace le fichier d'une note (changement de titre ou de rangement) sans le réécrire.
+    Retourne False si le déplacement a échoué : la note garde alors son ancien chemin.
+    """
+    entry = id_index[str(anki_id)]
+    old_path = entry["path"]
+    destination = os.path.join(OUTPUT_DIR, new_path)
+    if not is_free_for_note(destination, anki_id):
+        log(f"Note {anki_id} non déplacée : {new_path} existe déjà et n'est pas à elle.", 0)
+        return False
+    if sync_plan is not None:
+        plan_operation(destination, "rename", source=old_path)
+        entry["path"] = new_path
+        return True
+    try:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(os.path.join(OUTPUT_DIR, old_path), destination)
+    except OSError as e:
+        log(f"Erreur lors du déplacement de {old_path} : {e}", 0)
+        return False
+    entry["path"] = new_path
+    remove_empty_folders(old_path)
+    count("files_moved")
+    log(f"Note {anki_id} déplacée : {old_path} -> {new_path}", 2)
+    return True
+
+def remove_empty_folders(path):
+    """Supprime les dossiers devenus vides au-dessus de path, sans jamais remonter jusqu'à OUTPUT_DIR."""
+    folder = os.path.dirname(path)
+    while folder:
+        try:
+            os.rmdir(os.path.join(OUTPUT_DIR, folder))
+        except OSError:
+            return  # Dossier non vide (ou déjà supprimé)
+        folder = os.path.dirname(folder)
+
+# === Médias (images et sons) ===
+
+def get_attachment_files():
+    """Noms présents dans MEDIA_SUBDIR, listés une seule fois par sync."""
+    global attachment_files
+    if attachment_files is None:
+        media_dir = os.path.join(OUTPUT_DIR, MEDIA_SUBDIR)
+        if sync_plan is None:
+            os.makedirs(media_dir, exist_ok=True)
+        attachment_files = set(os.listdir(media_dir)) if os.path.isdir(media_dir) else set()
+    return attachment_files
+
+def hash_media_file(path):
+    """Empreinte SHA-1 du contenu, lue par blocs."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+            count("bytes_read", len(block))
+    count("files_read")
+    return digest.hexdigest()
+
+def link_or_copy(source, destination):
+    """Crée destination comme lien physique vers source, ou à défaut comme copie (atomique)."""
+    if sync_plan is not None:
+        plan_operation(destination, "create", media=source)
+        return
+    if MEDIA_HARDLINKS:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass  # Autre système de fichiers, ou liens non pris en charge
+    tmp_path = f"{destination}.tmp"
+    shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+def export_media_file(name):
+    """
+    Retourne le nom du média dans MEDIA_SUBDIR (empreinte du contenu + extension), en le
+    copiant s'il n'y est pas encore. Un média déjà exporté et inchangé (taille, mtime)
+    ne coûte qu'un stat ; deux fichiers identiques ne sont copiés qu'une fois.
+    Retourne None si le nom est vide, ou si ce n'est pas un fichier lisible de collection.media :
+    un média fautif ne fait jamais échouer la sync.
+    """
+    if name in resolved_media:
+        return resolved_media[name]
+    resolved_media[name] = None
+    if not name.strip():
+        return None  # <img src=""> désignerait le dossier collection.media lui-même
+    source = os.path.join(mw.col.media.dir(), name)
+    try:
+        info = os.stat(source)
+    except OSError:
+        info = None
+    if info is None or not stat.S_ISREG(info.st_mode):
+        log(f"Média introuvable dans collection.media : {name}", 2)
+        count("media_missing")
+        return None
+    entry = media_manifest.get(name)
+    attachments = get_attachment_files()
+    if not (entry and entry["size"] == info.st_size and entry["mtime"] == info.st_mtime
+            and entry["target"] in attachments):
+        try:
+            target = hash_media_file(source) + os.path.splitext(name)[1].lower()
+            if target not in attachments:
+                link_or_copy(source, os.path.join(OUTPUT_DIR, MEDIA_SUBDIR, target))
+                attachments.add(target)
+                count("media_written")
+        except OSError as e:
+            log(f"Erreur lors de la copie du média {name} : {e}", 0)
+            return None
+        entry = media_manifest[name] = {"size": info.st_size, "mtime": info.st_mtime, "target": target}
+    resolved_media[name] = entry["target"]
+    return entry["target"]
+
+def rewrite_media_links(content, prefix=""):
+    """
+    Exporte les médias référencés par <img src> et [sound:] et fait pointer les liens vers MEDIA_SUBDIR.
+    Les sons deviennent des balises <audio>. prefix ("../" par niveau de sous-dossier) rend les
+    chemins relatifs à la note.
+    """
+    if "[sound:" not in content and "<img" not in content.lower():
+        return content
+
+    def replace(match):
+        if match.group(5):
+            target = export_media_file(html.unescape(match.group(5)))
+            # Les champs sont du HTML brut : Obsidian n'y rend pas ![[...]], d'où une balise <audio>
+            return f'<audio controls src="{prefix}{MEDIA_SUBDIR}/{target}"></audio>' if target else match.group(0)
+        src = html.unescape(next(group for group in match.groups()[1:4] if group is not None))
+        if ":" in src or "/" in src:
+            return match.group(0)  # URL, data: ou chemin : pas un fichier de collection.media
+        target = export_media_file(src)
+        return f'{match.group(1)}"{prefix}{MEDIA_SUBDIR}/{target}"' if target else match.group(0)
+
+    return MEDIA_REF_PATTERN.sub(replace, content)
+
+# === Index de recherche plein texte (SQLite FTS5) ===
+
+def open_search_db():
+    """
+    Ouvre la base FTS_DB_PATH pour la sync en cours (après load_id_index). Si elle n'existe pas
+    encore, les "mod" de l'index sont oubliés pour que toutes les notes soient rendues et indexées.
+    En aperçu, la base n'est ni créée ni ouverte : les changements sont notés dans le plan
+    (sync_plan["search"]) et appliqués par apply_sync_plan().
+    """
+    global search_db
+    if not FTS_DB_PATH:
+        return
+    is_new = not os.path.exists(FTS_DB_PATH)
+    if sync_plan is None:
+        try:
+            search_db = sqlite3.connect(FTS_DB_PATH)
+            search_db.execute(
+                "create virtual table if not exists notes using fts5("
+                "title, text, tags, deck, path unindexed, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        except sqlite3.Error as e:
+            log(f"Base de recherche {FTS_DB_PATH} indisponible (FTS5 absent ?) : {e}", 0)
+            close_search_db()
+            return
+    if is_new:
+        log("Base de recherche créée : toutes les notes seront indexées.")
+        for entry in id_index.values():
+            entry.pop("mod", None)
+
+def update_search_entry(note, search_entry, path):
+    """Remplace la ligne de la note (rowid = ID Anki) par son titre, son texte, ses tags et son paquet."""
+    title, text = search_entry
+    write_search_row(["upsert", note.id, title, text, " ".join(note.tags), note.deck or "", path])
+
+def remove_search_entry(anki_id):
+    write_search_row(["delete", int(anki_id)])
+
+def write_search_row(change):
+    """Applique un changement ["upsert", rowid, titre, texte, tags, paquet, chemin] ou ["delete", rowid]."""
+    if sync_plan is not None:
+        if FTS_DB_PATH:
+            sync_plan["search"].append(change)
+        return
+    if search_db is None:
+        return
+    search_db.execute("delete from notes where rowid = ?", (change[1],))
+    if change[0] == "upsert":
+        search_db.execute("insert into notes(rowid, title, text, tags, deck, path) values (?, ?, ?, ?, ?, ?)",
+                          change[1:])
+        count("search_rows_written")
+
+def commit_search_db():
+    """Valide les changements de la base de recherche (avant toute sauvegarde de l'index)."""
+    if search_db is not None:
+        with timed("search"):
+            search_db.commit()
+
+def close_search_db():
+    global search_db
+    if search_db is not None:
+        commit_search_db()
+        search_db.close()
+        search_db = None
+
+# === Journal de sync (reprise après interruption) ===
+
+def read_sync_journal():
+    """
+    Relit le journal de la dernière sync complète : {"start", "checkpoint", "finished"},
+    ou None s'il est absent. Une ligne tronquée (arrêt brutal pendant l'écriture) est ignorée.
+    """
+    state = {"start": None, "checkpoint": None, "finished": False}
+    try:
+        with open(JOURNAL_PATH, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get("event") == "start":
+                    state["start"] = event
+                elif event.get("event") == "checkpoint":
+                    state["checkpoint"] = event
+                elif event.get("event") == "done":
+                    state["finished"] = True
+    except OSError:
+        return None
+    return state if state["start"] else None
+
+def append_sync_journal(event, truncate=False):
+    """Ajoute un événement au journal et le force sur disque avant de continuer."""
+    with open(JOURNAL_PATH, "w" if truncate else "a", encoding="utf-8") as f:
+        f.write(json.dumps(event) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def start_sync_journal(note_ids):
+    """
+    Ouvre le journal d'une sync complète (notes prévues, dans l'ordre). Si la sync précédente
+    sur les mêmes notes a été interrompue, retourne les IDs déjà traités jusqu'à son dernier
+    point de reprise : export_notes les saute s'ils n'ont pas changé depuis, même sans INCREMENTAL_SYNC.
+    Le journal est hors du coffre (JOURNAL_PATH) : celui d'une sync vers un autre coffre est ignoré.
+    """
+    global sync_journal
+    signature = hashlib.md5(ids2str(note_ids).encode("utf-8")).hexdigest()
+    previous = read_sync_journal()
+    if previous and previous["start"].get("vault") != OUTPUT_DIR:
+        previous = None
+    resumed_ids = set()
+    checkpoint = previous and previous["checkpoint"]
+    if (previous and not previous["finished"] and checkpoint and previous["start"].get("signature") == signature
+            and 0 < checkpoint["done"] <= len(note_ids) and note_ids[checkpoint["done"] - 1] == checkpoint["last_id"]):
+        resumed_ids = set(note_ids[:checkpoint["done"]])
+        log(f"Reprise de la sync interrompue : {len(resumed_ids)} note(s) déjà traitée(s).")
+        count("notes_resumed", len(resumed_ids))
+    elif previous and not previous["finished"]:
+        log("Sync précédente interrompue : reprise impossible, export complet.")
+    if previous and not previous["finished"]:
+        # Les fichiers écrits après le dernier point de reprise ne sont pas dans l'index sauvegardé :
+        # on les retrouve par leur première ligne plutôt que de créer des doublons
+        for anki_id, entry in rebuild_id_index().items():
+            id_index.setdefault(anki_id, entry)
+    os.makedirs(os.path.dirname(JOURNAL_PATH), exist_ok=True)
+    append_sync_journal({"event": "start", "time": time.time(), "planned": len(note_ids), "signature": signature,
+                         "vault": OUTPUT_DIR}, truncate=True)
+    if resumed_ids:
+        # Le point de reprise est recopié : une nouvelle interruption ne le perd pas
+        append_sync_journal(checkpoint)
+    sync_journal = {"last_checkpoint": time.monotonic()}
+    return resumed_ids
+
+def checkpoint_sync_journal(done, last_id):
+    """
+    Point de reprise : les done premières notes prévues sont écrites. L'index est sauvegardé
+    avant le journal, pour qu'un point de reprise ne devance jamais l'index sur disque.
+    """
+    if sync_journal is None or time.monotonic() - sync_journal["last_checkpoint"] < JOURNAL_CHECKPOINT_SECONDS:
+        return
+    commit_search_db()
+    save_id_index()
+    append_sync_journal({"event": "checkpoint", "done": done, "last_id": last_id})
+    sync_journal["last_checkpoint"] = time.monotonic()
+    count("journal_checkpoints")
+
+def close_sync_journal(finished):
+    """Termine le journal ; une sync non terminée le laisse ouvert pour la prochaine reprise."""
+    global sync_journal
+    if sync_journal is not None and finished:
+        append_sync_journal({"event": "done", "time": time.time()})
+    sync_journal = None
+
+# === Fonction d'export vers Obsidian ===
+
+def render_note(note):
+    """
+    Rendu d'une note, sans accès à Anki ni au disque. Retourne (content_to_write, base_filename, skip_message,
+    search_entry) ; skip_message est renseigné quand la note doit être ignorée, search_entry vaut
+    (titre, texte brut) si FTS_DB_PATH est configuré.
+    """
+    nid = note.id  # Identifiant Anki de la note
+    model = note.model
+    model_name = model["name"].lower()
+
+    # --- 1. Générer les hashtags individuels pour le corps de la note Obsidian ---
+    obsidian_tags_for_body = []
+    for tag in note.tags:
+        if tag:
+            parts = [p.strip() for p in tag.split("::") if p.strip()]
+            for part in parts:
+                hashtag = f"#{part}"
+                if hashtag not in obsidian_tags_for_body:
+                    obsidian_tags_for_body.append(hashtag)
+    # Créer la ligne de texte pour le corps de la note (sera ajoutée plus tard)
+    tags_md_line_for_body = "Tags: " + " ".join(obsidian_tags_for_body) if obsidian_tags_for_body else ""
+
+    # --- 2. Extraire le contenu et le titre ---
+    if any(name.strip().lower() == ANKI_FIELD_NAME.strip().lower() for name in model["field_names"]):
+        raw_html_original = get_field_by_name(note, ANKI_FIELD_NAME)
+        if not raw_html_original:
+            return None, None, f"Note {nid} ignorée (champ '{ANKI_FIELD_NAME}' vide).", None
+        html_body_no_cloze = remove_cloze_keep_html(raw_html_original)
+        title = extract_title_from_html(html_body_no_cloze, TITLE_MAX_LENGTH)
+        search_html = html_body_no_cloze
+        if CLOZE_RENDER_MODE != "plain":
+            # Le titre reste tiré du texte sans marqueurs ; seul le corps garde les occlusions
+            html_body_no_cloze = render_clozes(raw_html_original, CLOZE_RENDER_MODE)
+        content_body = html_body_no_cloze.strip()
+    elif model_name in (t.lower() for t in RECTO_VERSO_TYPES):
+        recto_field = note.fields[0] if note.fields else ""
+        if not recto_field:
+            return None, None, f"Note {nid} ignorée (champ 'Recto' vide).", None
+        title = extract_title_from_html(recto_field, TITLE_MAX_LENGTH)
+        verso_parts = note.fields[1:] if len(note.fields) > 1 else []
+        if not verso_parts:
+            return None, None, f"Note {nid} ignorée (aucun contenu pour le verso).", None
+        content_body = "\n\n".join(verso_parts).strip()
+        search_html = f"{recto_field}\n{content_body}"
+    else:
+        return None, None, f"Note {nid} ignorée (type de carte non supporté: {model['name']}).", None
+
+    # --- 3. Assembler le contenu final, avec l'ID caché en première ligne et la ligne de tags ---
+    hidden_id_line = f"<!-- anki_id: {nid} -->"
+    content_to_write = f"{hidden_id_line}\n{content_body}\n\n---\n\n{tags_md_line_for_body}".strip()
+    base_filename = sanitize_filename(title, max_length=TITLE_MAX_LENGTH)
+    search_entry = (title, html_to_text(search_html)) if FTS_DB_PATH else None
+    return content_to_write, base_filename, None, search_entry
+
+def export_notes(notes, total=None, only_tag_files=None, resumed_ids=None):
+    """
+    Exporte les notes (itérable de NoteRecord) ; total sert uniquement à la progression.
+    only_tag_files limite l'écriture aux fiches de tag indiquées (export en direct).
+    resumed_ids : notes déjà traitées par une sync interrompue (cf. start_sync_journal).
+    Le rendu se fait par lots, dans le thread de la sync ; le nommage des fichiers
+    et les écritures suivent l'ordre des notes.
+    """
+
+    if sync_plan is None:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+    seed_filename_allocator()
+    resumed_ids = resumed_ids or set()
+    created_folders = set()
     seen_hashes = set()
     exported_count = 0
+    unchanged_count = 0
 
-    print(f"Début de l'exportation vers : {OUTPUT_DIR}")
-
-    for note in notes:
-        nid = note.id  # Identifiant Anki de la note
-        model = note.model()
-        model_name = model.get("name", "").lower()
-
-        # --- 1. Préparer les listes de tags ---
-        # Garder la liste brute pour la mise à jour des fichiers de tag plus tard
-        raw_tags_for_files = note.tags if hasattr(note, "tags") else []
-        if not raw_tags_for_files:
-            raw_tags_for_files = [None] # Pour traiter les notes sans tag si nécessaire
-
-        # Générer les hashtags individuels pour le corps de la note Obsidian
-        obsidian_tags_for_body = []
-        temp_tags_list = note.tags if hasattr(note, "tags") else [] # Utiliser une liste temporaire ici
-        for tag in temp_tags_list:
-            if tag:
-                parts = [p.strip() for p in tag.split("::") if p.strip()]
-                for part in parts:
-                    hashtag = f"#{part}"
-                    if hashtag not in obsidian_tags_for_body:
-                        obsidian_tags_for_body.append(hashtag)
-        # Créer la ligne de texte pour le corps de la note (sera ajoutée plus tard)
-        tags_md_line_for_body = "Tags: " + " ".join(obsidian_tags_for_body) if obsidian_tags_for_body else ""
-
-        # --- SUPPRIMER LA PREMIÈRE BOUCLE INCORRECTE D'ICI ---
-
-        # --- 2. Extraire le contenu et le titre ---
-        content_body = ""
-        title = "Sans titre" # Initialisation par défaut
-
-        if any(fld["name"].strip().lower() == ANKI_FIELD_NAME.strip().lower() for fld in model["flds"]):
-            raw_html_original = get_field_by_name(note, ANKI_FIELD_NAME)
-            if not raw_html_original:
-                print(f"Note {nid} ignorée (champ '{ANKI_FIELD_NAME}' vide).")
+    log(f"Début de l'exportation vers : {OUTPUT_DIR}")
+
+    def write_batch(batch):
+        nonlocal exported_count, unchanged_count
+        render_start = time.perf_counter()
+        rendered = [render_note(note) for note in batch]
+        add_time("render", time.perf_counter() - render_start)
+
+        for note, (content_to_write, base_filename, skip_message, search_entry) in zip(batch, rendered):
+            nid = note.id
+            if skip_message:
+                log(skip_message, 2)
+                continue
+
+            # --- 4. Déterminer le nom de fichier final et son dossier (VAULT_LAYOUT) ---
+            existing_path = find_existing_file_by_id(nid)
+            folder = get_note_folder(note)
+            list_folder_names(folder)
+            if existing_path:
+                filename_final = choose_note_stem(nid, existing_path, base_filename)
+            else:
+                filename_final = allocate_filename(base_filename)
+            relative_path = f"{folder}/{filename_final}.md" if folder else f"{filename_final}.md"
+            while relative_path != existing_path and not is_free_for_note(os.path.join(OUTPUT_DIR, relative_path), nid):
+                # Destination occupée par un fichier qui n'est pas cette note : on prend le nom suivant
+                log(f"{relative_path} existe déjà et n'est pas la note {nid} : autre nom choisi.", 2)
+                filename_final = allocate_filename(base_filename)
+                relative_path = f"{folder}/{filename_final}.md" if folder else f"{filename_final}.md"
+            if existing_path and existing_path != relative_path and not move_exported_note(nid, relative_path):
+                relative_path, filename_final = existing_path, note_stem(existing_path)
+            elif folder and not existing_path and folder not in created_folders and sync_plan is None:
+                os.makedirs(os.path.join(OUTPUT_DIR, folder), exist_ok=True)
+                created_folders.add(folder)
+
+            if EXPORT_MEDIA:
+                with timed("media"):
+                    content_to_write = rewrite_media_links(content_to_write, "../" * relative_path.count("/"))
+
+            # Vérification de hash (optionnel) - Utiliser content_to_write
+            content_hash = hashlib.md5((content_to_write + str(nid)).encode("utf-8")).digest()
+            if content_hash in seen_hashes:
+                log(f"Note {nid} déjà traitée (hash identique), ignorée.", 2)
                 continue
-            html_body_no_cloze = remove_cloze_keep_html(raw_html_original)
-            title = extract_title_from_html(html_body_no_cloze, TITLE_MAX_LENGTH)
-            # Ne pas ajouter tags_md_line ici, on le fera à la fin
-            content_body = html_body_no_cloze.strip()
-        elif model_name in (t.lower() for t in RECTO_VERSO_TYPES):
-            recto_field = note.fields[0] if note.fields else ""
-            if not recto_field:
-                print(f"Note {nid} ignorée (champ 'Recto' vide).")
+            seen_hashes.add(content_hash)
+
+            # --- 5. Écriture du fichier note (sautée si le contenu est identique, ex. seule la date Anki a bougé) ---
+            filepath = os.path.join(OUTPUT_DIR, relative_path)
+            entry = id_index.get(str(nid)) if existing_path else None
+            try:
+                with timed("write"):
+                    written = write_file_if_changed(filepath, content_to_write, cached=entry)
+                if written:
+                    log(f"Note {nid} exportée : {filepath}", 2)
+                    exported_count += 1
+                else:
+                    unchanged_count += 1
+                record_in_id_index(nid, relative_path, content_to_write, mod=note.mod, tags=note.tags)
+            except Exception as e:
+                log(f"Erreur lors de l'écriture du fichier {filepath}: {e}", 0)
+                # Si l'écriture échoue, on ne veut pas traiter les tags pour cette note
                 continue
-            title = extract_title_from_html(recto_field, TITLE_MAX_LENGTH)
-            verso_parts = note.fields[1:] if len(note.fields) > 1 else []
-            if not verso_parts:
-                print(f"Note {nid} ignorée (aucun contenu pour le verso).")
+
+            if search_entry is not None:
+                update_search_entry(note, search_entry, relative_path)
+
+            # --- 6. Enregistrer la note dans le graphe des tags ---
+            add_note_to_tag_graph(note.tags, filename_final)
+
+    batch = []
+    for i, note in enumerate(notes):
+        if i % PROGRESS_EVERY == 0:
+            report_progress(f"Export des notes ({i}/{total})...", i, total)
+
+        # --- 0. Sync incrémentale : note inchangée depuis la dernière sync et déjà bien rangée ---
+        # (une note à déplacer est re-rendue : les liens relatifs vers les médias dépendent du dossier)
+        if (INCREMENTAL_SYNC or note.id in resumed_ids) and is_note_unchanged(note.id, note.mod):
+            entry = id_index[str(note.id)]
+            folder = get_note_folder(note)
+            stem = note_stem(entry["path"])
+            if entry["path"] == (f"{folder}/{stem}.md" if folder else f"{stem}.md"):
+                add_note_to_tag_graph(entry.get("tags"), stem)
+                unchanged_count += 1
                 continue
-            body_html = "\n\n".join(verso_parts)
-            # Ne pas ajouter tags_md_line ici
-            content_body = body_html.strip()
-        else:
-            print(f"Note {nid} ignorée (type de carte non supporté: {model.get('name','')}).")
-            continue
 
-        # --- 3. Déterminer le nom de fichier final ---
-        existing_filename = find_existing_file_by_id(nid)
-        filename_final = None # Initialisation
+        batch.append(note)
+        if len(batch) >= RENDER_BATCH_SIZE:
+            write_batch(batch)
+            batch = []
+            checkpoint_sync_journal(i + 1, note.id)
+    if batch:
+        write_batch(batch)
+
+    # --- Fin de la boucle principale 'for note in notes:' ---
+    count("notes_exported", exported_count)
+    count("notes_unchanged", unchanged_count)
+
+    log(f"Exportation terminée : {exported_count} note(s) écrite(s), {unchanged_count} inchangée(s).")
+    # Les fichiers de tag puis l'index sont écrits une seule fois, après avoir traité toutes les notes
+    write_tag_files(only_tag_files)
+    update_index_file()
+
+# === Graphe des tags ===
+
+def reset_tag_state():
+    """Vide le graphe et les ensembles de tags avant une nouvelle sync."""
+    tag_graph.clear()
+    tag_notes_set.clear()
+    top_level_tag_set.clear()
 
-        if existing_filename:
-            filename_final = existing_filename[:-3]
+def get_tag_node(tag):
+    """Retourne (en la créant au besoin) l'entrée du graphe pour ce tag."""
+    tag_filename = sanitize_filename(tag)
+    return tag_graph.setdefault(tag_filename, {"title": tag, "notes": set(), "children": set()})
+
+def add_note_to_tag_graph(tags, note_link):
+    """Ajoute une note au graphe pour chacun de ses tags (ou à "Sans tag" si elle n'en a pas)."""
+    for tag in tags or [None]:
+        if tag and "::" in tag:
+            # Appeler la fonction pour les tags hiérarchiques
+            update_hierarchical_tag_files(tag, note_link)
         else:
-            base_filename = sanitize_filename(title, max_length=TITLE_MAX_LENGTH) # Utilise le 'title' déterminé avant
-            filename_final = base_filename
-            suffix = 1
-            while os.path.exists(os.path.join(OUTPUT_DIR, f"{filename_final}.md")):
-                filename_final = f"{base_filename}_{suffix}"
-                suffix += 1
-
-        # --- 4. Préparer et écrire le contenu final de la note ---
-        hidden_id_line = f"<!-- anki_id: {nid} -->"
-        # Construire le contenu final ICI, en ajoutant la ligne de tags
-        content_to_write = f"{hidden_id_line}\n{content_body}\n\n---\n\n{tags_md_line_for_body}".strip()
-
-        # Vérification de hash (optionnel) - Utiliser content_to_write
-        content_hash = hashlib.md5((content_to_write + str(nid)).encode("utf-8")).hexdigest()
-        if content_hash in seen_hashes:
-            print(f"Note {nid} déjà traitée (hash identique), ignorée.")
-            continue
-        seen_hashes.add(content_hash)
+            # Appeler la fonction pour les tags simples (ou None)
+            update_tag_file(tag, note_link, add_to_index=True)
+
+def render_tag_file(node):
+    """Construit le contenu complet d'une fiche de tag à partir de son entrée dans le graphe."""
+    tag = node["title"]
+    lines = [f"# {tag}"]
+    if node["notes"]:
+        lines.append("")
+        lines.append("Liste des notes liées:")
+        lines.extend(f"- [[{note_link}]]" for note_link in sorted(node["notes"]))
+    if node["children"]:
+        lines.append("")
+        lines.append("Tags liés:")
+        lines.extend(f"[[{child}]]" for child in sorted(node["children"]))
+    lines.append("")
+    lines.append(f"#{tag.lower()}")
+    return "\n".join(lines) + "\n"
+
+def get_tag_filenames(tags):
+    """Noms des fiches de tag (parents hiérarchiques compris) concernées par ces tags."""
+    filenames = set()
+    for tag in tags or [None]:
+        if tag and "::" in tag:
+            filenames.update(sanitize_filename(p.strip()) for p in tag.split("::") if p.strip())
+        else:
+            filenames.add(sanitize_filename(tag or "Sans tag"))
+    return filenames
 
-        # Écriture du fichier note
-        filepath = os.path.join(OUTPUT_DIR, f"{filename_final}.md")
+@timed("tag_files")
+def write_tag_files(only=None):
+    """
+    Écrit chaque fiche de tag une seule fois, en sautant celles dont le contenu n'a pas changé.
+    Si only est fourni, seules ces fiches (noms de fichier) sont rendues.
+    """
+    report_progress("Écriture des fichiers de tag...")
+    written_count = 0
+    for tag_filename, node in tag_graph.items():
+        if only is not None and tag_filename not in only:
+            continue
         try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(content_to_write)
-            print(f"Note {nid} exportée : {filepath}")
-            exported_count += 1
+            if write_generated_file(f"{tag_filename}.md", render_tag_file(node)):
+                written_count += 1
         except Exception as e:
-            print(f"Erreur lors de l'écriture du fichier {filepath}: {e}")
-            # Si l'écriture échoue, on ne veut pas traiter les tags pour cette note
-            continue
+            log(f"Erreur lors de l'écriture du fichier tag {tag_filename}.md: {e}", 0)
+    log(f"Fichiers de tag : {written_count} écrit(s) sur {len(tag_graph)}.")
+    remove_stale_tag_files()
 
-        # --- 5. Mettre à jour les fichiers de tag (CORRECTEMENT PLACÉ ICI) ---
-        # Utiliser la liste brute des tags originaux de la note
-        for tag in raw_tags_for_files:
-            if tag and "::" in tag:
-                # Appeler la fonction pour les tags hiérarchiques
-                update_hierarchical_tag_files(tag, filename_final)
+def remove_stale_tag_files():
+    """
+    Supprime les fiches de tag générées lors d'une sync précédente (présentes dans file_hash_cache)
+    dont le tag n'est plus porté par aucune note : absentes du graphe, elles ne seraient plus
+    jamais réécrites et garderaient des liens vers des notes supprimées.
+    """
+    index_filename = os.path.basename(INDEX_NOTE_PATH)
+    for filename in list(file_hash_cache):
+        if "/" in filename or not filename.endswith(".md") or filename == index_filename:
+            continue
+        if filename[:-3] in tag_graph:
+            continue
+        filepath = os.path.join(OUTPUT_DIR, filename)
+        try:
+            if sync_plan is not None:
+                if not os.path.exists(filepath):
+                    raise FileNotFoundError(filepath)
+                plan_operation(filepath, "delete")
             else:
-                # Appeler la fonction pour les tags simples (ou None)
-                # S'assurer que add_to_index=True est la valeur par défaut ou est spécifié
-                update_tag_file(tag, filename_final, add_to_index=True)
-
-    # --- Fin de la boucle principale 'for note in notes:' ---
-
-    print(f"Exportation terminée : {exported_count} note(s écrite(s).")
-    # La mise à jour de l'index se fait après avoir traité toutes les notes
-    update_index_file()
+                os.remove(filepath)
+            count("files_deleted")
+            log(f"Fiche de tag obsolète supprimée : {filename}", 2)
+        except FileNotFoundError:
+            pass  # Déjà supprimée à la main : on l'oublie simplement
+        except OSError as e:
+            log(f"Erreur lors de la suppression de la fiche de tag {filepath}: {e}", 0)
+            continue
+        file_hash_cache.pop(filename, None)
+        tag_notes_set.discard(filename[:-3])
 
-# Ajouter le paramètre add_to_index=True par défaut
 def update_tag_file(tag_name, note_link, add_to_index=True):
+    """
+    Ajoute le lien vers la note à la fiche du tag dans le graphe en mémoire.
+    Le fichier lui-même est écrit une seule fois par write_tag_files().
+    """
     tag_name = tag_name or "Sans tag"   # Si tag_name est None, le remplacer par "Sans tag"
-    tag_clean = tag_name
-    tag_filename = sanitize_filename(tag_clean)
-    tag_filepath = os.path.join(OUTPUT_DIR, f"{tag_filename}.md")
+    node = get_tag_node(tag_name)
+    tag_filename = sanitize_filename(tag_name)
 
     # Ajouter à l'ensemble pour l'index SEULEMENT si demandé
     if add_to_index:
@@ -257,66 +1450,12 @@ def update_tag_file(tag_name, note_link, add_to_index=True):
         if "::" not in tag_name:
             top_level_tag_set.add(tag_filename)
 
-    tag_hashtag = f"#{tag_clean.lower()}"
-
-    lines = []
-    if os.path.exists(tag_filepath):
-        # SI LE FICHIER EXISTE : Lire son contenu
-        try: # Bonne pratique d'ajouter un try/except pour la lecture
-            with open(tag_filepath, "r", encoding="utf-8") as f:
-                lines = f.read().splitlines() # Charger les lignes existantes
-            # Optionnel: Nettoyer les lignes vides à la fin et le dernier hashtag si présent
-            while lines and lines[-1].strip() == "":
-                lines.pop()
-            if lines and lines[-1].strip() == tag_hashtag: # Utiliser tag_hashtag défini plus bas
-                lines.pop()
-        except Exception as e:
-            print(f"Erreur lors de la lecture du fichier tag existant {tag_filepath}: {e}")
-            # Que faire en cas d'erreur de lecture ? Revenir à la valeur par défaut?
-            lines = [f"# {tag_clean}", "", "Liste des notes liées:"] # Ou juste initialiser lines = [] ?
-
-    else:
-        # SI LE FICHIER N'EXISTE PAS : Initialiser avec l'en-tête
-        lines = [f"# {tag_clean}", "", "Liste des notes liées:"]
-
-    # Définir tag_hashtag ici pour qu'il soit disponible dans le 'if' ci-dessus
-    tag_hashtag = f"#{tag_clean.lower()}"
-
-    # ... (le reste de la fonction pour ajouter note_line, le hashtag final, et écrire le fichier) ...
-
-    note_line = f"- [[{note_link}]]"
-    if note_line not in lines:
-        # Ajouter la ligne de note *après* le titre et l'en-tête potentiel
-        if lines and lines[-1].strip().lower() == "liste des notes liées:":
-             lines.append(note_line)
-        elif not lines: # Cas où le fichier était vide ou erreur de lecture
-             lines = [f"# {tag_clean}", "", "Liste des notes liées:", note_line]
-        else: # Ajouter à la fin si l'en-tête n'est pas là
-             lines.append(note_line)
-
-    # Assurer que le hashtag est à la fin et qu'il y a une ligne vide avant (sauf si vide)
-    if lines and lines[-1].strip() != tag_hashtag:
-         # Enlever le hashtag s'il est ailleurs
-         lines = [l for l in lines if l.strip() != tag_hashtag]
-         # Ajouter une ligne vide si nécessaire
-         if lines and lines[-1].strip() != "":
-             lines.append("")
-         lines.append(tag_hashtag)
-    elif not lines: # Si le fichier était vide
-         lines = [f"# {tag_clean}", "", "Liste des notes liées:", note_line, "", tag_hashtag]
-
-
-    new_content = "\n".join(lines) + "\n"
-    try:
-        with open(tag_filepath, "w", encoding="utf-8") as f:
-            f.write(new_content)
-    except Exception as e:
-        print(f"Erreur lors de l'écriture du fichier tag {tag_filepath}: {e}")
+    node["notes"].add(note_link)
 
 def update_hierarchical_tag_files(tag_str, note_link):
     # ... (début inchangé) ...
     parts = [p.strip() for p in tag_str.split("::") if p.strip()]
-    print(f"[DEBUG] Hierarchical tag parts: {parts}")
+    log(f"[DEBUG] Hierarchical tag parts: {parts}", 3)
     if not parts:
         return
     if len(parts) == 1:
@@ -325,7 +1464,7 @@ def update_hierarchical_tag_files(tag_str, note_link):
     else:
         top = sanitize_filename(parts[0])
         top_level_tag_set.add(top)
-        print(f"[DEBUG] Added top-level tag: {top}")
+        log(f"[DEBUG] Added top-level tag: {top}", 3)
         update_parent_tag_file(parts[0], child=parts[1])
         for i in range(1, len(parts) - 1):
             update_parent_tag_file(parts[i], child=parts[i+1])
@@ -333,37 +1472,13 @@ def update_hierarchical_tag_files(tag_str, note_link):
 
 def update_parent_tag_file(tag, child=None):
     """
-    Met à jour la fiche d'un tag parent pour y ajouter, sous la section "Tags liés:",
-    un lien vers le tag enfant. Cette fiche ne reçoit pas le lien vers la note.
+    Ajoute à la fiche d'un tag parent, sous la section "Tags liés:", un lien vers
+    le tag enfant (dans le graphe en mémoire). Cette fiche ne reçoit pas le lien vers la note.
     """
-    tag_filename = sanitize_filename(tag)
-    tag_filepath = os.path.join(OUTPUT_DIR, f"{tag_filename}.md")
-    lines = []
-    if os.path.exists(tag_filepath):
-        with open(tag_filepath, "r", encoding="utf-8") as f:
-            lines = f.read().splitlines()
-    else:
-        lines = [f"# {tag}"]
-    
-    # Assurer qu'il existe une section "Tags liés:"
-    if not any(line.strip().lower() == "tags liés:" for line in lines):
-        lines.append("")
-        lines.append("Tags liés:")
-    
-    # Ajouter le lien vers l'enfant s'il n'est pas déjà présent
+    node = get_tag_node(tag)
     if child:
-        child_link = f"[[{sanitize_filename(child)}]]"
-        if not any(child_link in line for line in lines):
-            lines.append(child_link)
-    
-    # Ajoute le hashtag (par exemple, "#tag") en bas s'il n'est pas déjà présent
-    if not any(line.strip() == f"#{tag.lower()}" for line in lines):
-        lines.append("")
-        lines.append(f"#{tag.lower()}")
-    
-    with open(tag_filepath, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines) + "\n")
-    tag_notes_set.add(tag_filename)
+        node["children"].add(sanitize_filename(child))
+    tag_notes_set.add(sanitize_filename(tag))
 
 def update_tag_file_bottom(tag):
     """
@@ -386,8 +1501,7 @@ def update_tag_file_bottom(tag):
     if not any(line.strip() == f"#{tag.lower()}" for line in lines):
         lines.append("")
         lines.append(f"#{tag.lower()}")
-    with open(tag_filepath, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines) + "\n")
+    write_file_if_changed(tag_filepath, "\n".join(lines) + "\n")
     tag_notes_set.add(tag_filename)
 
 def update_tag_file_hierarchical_parent(tag, note_link, child=None):
@@ -430,8 +1544,7 @@ def update_tag_file_hierarchical_parent(tag, note_link, child=None):
         lines.append("")
         lines.append(f"#{tag.lower()}")
     
-    with open(tag_filepath, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines) + "\n")
+    write_file_if_changed(tag_filepath, "\n".join(lines) + "\n")
     tag_notes_set.add(tag_filename)
 
 def update_parent_child_link(parent, child):
@@ -454,12 +1567,84 @@ def update_parent_child_link(parent, child):
     child_link = f"[[{sanitize_filename(child)}]]"
     if not any(child_link in line for line in lines):
         lines.append(child_link)
-    with open(parent_filepath, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines) + "\n")
+    write_file_if_changed(parent_filepath, "\n".join(lines) + "\n")
     tag_notes_set.add(parent_filename)
 
+def index_page_key(tag_note):
+    """Lettre de la page d'index d'une fiche : initiale sans accent, "0-9" ou "Autres"."""
+    for char in unicodedata.normalize("NFKD", tag_note):
+        if char.isalpha() and char.isascii():
+            return char.upper()
+        if char.isdigit():
+            return "0-9"
+        if char.isalnum():
+            return "Autres"
+    return "Autres"
+
+def paginate_index(tag_notes):
+    """
+    Répartit les fiches triées en pages {nom de page: [fiches]} : une page par lettre, découpée
+    en "Anki - A", "Anki - A 2"... au-delà de INDEX_PAGE_MAX_ENTRIES. Ajouter une fiche ne
+    change donc que la page de sa lettre.
+    """
+    index_name = os.path.splitext(os.path.basename(INDEX_NOTE_PATH))[0]
+    groups = {}
+    for tag_note in tag_notes:
+        groups.setdefault(index_page_key(tag_note), []).append(tag_note)
+    pages = {}
+    for key in sorted(groups):
+        entries = groups[key]
+        for part, i in enumerate(range(0, len(entries), INDEX_PAGE_MAX_ENTRIES), start=1):
+            page_name = f"{index_name} - {key}" if part == 1 else f"{index_name} - {key} {part}"
+            pages[page_name] = entries[i:i + INDEX_PAGE_MAX_ENTRIES]
+    return pages
+
+def write_index_pages(pages):
+    """
+    Écrit les pages d'index dans INDEX_PAGES_SUBDIR (seulement celles dont le contenu change)
+    et supprime les pages qui ne sont plus produites.
+    """
+    index_name = os.path.splitext(os.path.basename(INDEX_NOTE_PATH))[0]
+    pages_dir = os.path.join(OUTPUT_DIR, INDEX_PAGES_SUBDIR)
+    if pages and sync_plan is None:
+        os.makedirs(pages_dir, exist_ok=True)
+    written = 0
+    for page_name, entries in pages.items():
+        lines = [f"# {page_name}", "", f"[[{index_name}]]", ""]
+        lines.extend(f"- [[{tag_note}]]" for tag_note in entries)
+        if write_generated_file(f"{INDEX_PAGES_SUBDIR}/{page_name}.md", "\n".join(lines) + "\n"):
+            written += 1
+    try:
+        existing = os.listdir(pages_dir)
+    except OSError:
+        existing = []
+    for filename in existing:
+        if not (filename.startswith(f"{index_name} - ") and filename.endswith(".md")) or filename[:-3] in pages:
+            continue
+        filepath = os.path.join(pages_dir, filename)
+        try:
+            if sync_plan is not None:
+                plan_operation(filepath, "delete")
+            else:
+                os.remove(filepath)
+            count("files_deleted")
+            file_hash_cache.pop(f"{INDEX_PAGES_SUBDIR}/{filename}", None)
+        except OSError as e:
+            log(f"Erreur lors de la suppression de la page d'index {filepath}: {e}", 0)
+    if sync_plan is None and not pages:
+        with contextlib.suppress(OSError):
+            os.rmdir(pages_dir)  # Seulement s'il est vide
+    if pages:
+        log(f"Pages d'index : {written} écrite(s) sur {len(pages)}.")
+
+@timed("index")
 def update_index_file():
-    print(f"[DEBUG] top_level_tag_set = {top_level_tag_set}")
+    """
+    Écrit Anki.md : les tags de premier niveau, puis la liste des fiches de tag. Au-delà de
+    INDEX_PAGE_MAX_ENTRIES fiches, cette liste est remplacée par des liens vers des pages par
+    lettre (write_index_pages), pour qu'Anki.md reste petit et ne change presque jamais.
+    """
+    log(f"[DEBUG] top_level_tag_set = {top_level_tag_set}", 3)
     index_lines = []
     # Partie 1 : Index des tags parents (top-level)
     if top_level_tag_set:
@@ -476,65 +1661,74 @@ def update_index_file():
     index_lines.append("")
     index_lines.append("")
 
-    # Partie 2 : Index complet des fiches de tag
-    if tag_notes_set:
+    # Partie 2 : Index complet des fiches de tag (directement, ou par pages)
+    tag_notes = sorted(tag_notes_set)
+    paginated = INDEX_PAGE_MAX_ENTRIES and len(tag_notes) > INDEX_PAGE_MAX_ENTRIES
+    pages = paginate_index(tag_notes) if paginated else {}
+    if tag_notes:
         index_lines.append("# 📘 Index complet des fiches de tag")
         index_lines.append("")
         index_lines.append("- [[Index]]")
         index_lines.append("")
-        for tag_note in sorted(tag_notes_set):
-            index_lines.append(f"- [[{tag_note}]]")
+        for entry in (pages or tag_notes):
+            index_lines.append(f"- [[{entry}]]")
     else:
         index_lines.append("Aucune fiche de tag à indexer.")
     
     # Écriture unique du contenu combiné dans le fichier INDEX_NOTE_PATH
     try:
-        with open(INDEX_NOTE_PATH, "w", encoding="utf-8") as f:
-            f.write("\n".join(index_lines))
-        print(f"Fichier d'index mis à jour : {INDEX_NOTE_PATH}")
+        if write_file_if_changed(INDEX_NOTE_PATH, "\n".join(index_lines),
+                                 cached=file_hash_cache.setdefault(os.path.basename(INDEX_NOTE_PATH), {})):
+            log(f"Fichier d'index mis à jour : {INDEX_NOTE_PATH}")
+        write_index_pages(pages)
     except Exception as e:
-        print(f"Erreur lors de l'écriture du fichier d'index: {e}")
+        log(f"Erreur lors de l'écriture du fichier d'index: {e}", 0)
 
+@timed("cleanup")
 def clean_old_files(current_ids):
     """
-    Parcourt les fichiers .md dans OUTPUT_DIR et supprime ceux dont
-    le commentaire caché <!-- anki_id: X --> ne correspond pas à un ID
-    présent dans current_ids (la source de vérité d'Anki).
+    Supprime les fichiers des notes qui ne sont plus dans current_ids (la source de vérité d'Anki).
+    Les suppressions se déduisent de l'index, manifeste des IDs exportés : IDs de la sync
+    précédente moins ceux de la sync actuelle. Seuls les fichiers concernés sont touchés.
+    Si l'index manquait, load_id_index() l'a reconstruit en lisant la première ligne de chaque fichier.
     """
-    import re
-    for filename in os.listdir(OUTPUT_DIR):
-        if filename.endswith(".md"):
-            filepath = os.path.join(OUTPUT_DIR, filename)
-            try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    content = f.read()
-                # Cherche le commentaire caché contenant l'ID Anki
-                match = re.search(r"<!--\s*anki_id:\s*(\d+)\s*-->", content)
-                if match:
-                    file_id = match.group(1)
-                    if file_id not in current_ids:
-                        os.remove(filepath)
-                        print(f"Fichier supprimé {filepath} (ID {file_id} introuvable).")
-            except Exception as e:
-                print(f"Erreur lors de la vérification de {filepath} : {e}")
+    report_progress("Nettoyage des fichiers obsolètes...")
+    stale_ids = [anki_id for anki_id in id_index if anki_id not in current_ids]
+    for anki_id in stale_ids:
+        remove_exported_note(anki_id)
 
 # === Fonction pour nettoyer les tags liés à la fiche 'Anki' mais qui ne sont liés à aucune note ===
 
 # === Fonction pour nettoyer les tags liés à la fiche 'Anki' mais qui ne sont liés à aucune note ===
 
+@timed("cleanup")
 def clean_tag_files():
     """
     Parcourt les fichiers de tags et retire les lignes qui font référence à des notes supprimées.
     Supprime les fichiers de tag s'ils deviennent vides de liens (notes et tags).
+    Les liens sont vérifiés contre un instantané unique du dossier (aucun stat par lien),
+    et un fichier n'est réécrit que si des lignes ont effectivement été retirées.
     """
+    # Fiches à la racine du coffre, plus les notes de l'index (éventuellement rangées dans des sous-dossiers)
+    root_files = os.listdir(OUTPUT_DIR) if os.path.isdir(OUTPUT_DIR) else []  # Absent en aperçu d'une première sync
+    existing_files = {name[:-3] for name in root_files if name.endswith(".md")}
+    existing_files.update(note_stem(entry["path"]) for entry in id_index.values())
+    if sync_plan is not None:
+        # En aperçu, les fiches prévues par le plan comptent comme écrites
+        existing_files.update(path[:-3] for path, operation in sync_plan["operations"].items()
+                              if "content" in operation and "/" not in path and path.endswith(".md"))
     # Utiliser list() pour pouvoir modifier tag_notes_set pendant l'itération si besoin
     for tag_filename in list(tag_notes_set):
         tag_filepath = os.path.join(OUTPUT_DIR, f"{tag_filename}.md")
-        if os.path.exists(tag_filepath):
+        if tag_filename in existing_files:
             try:
-                with open(tag_filepath, "r", encoding="utf-8") as f:
-                    # Lire les lignes ici pour éviter les problèmes avec readlines() + strip()
-                    lines = f.read().splitlines()
+                planned = sync_plan["operations"].get(f"{tag_filename}.md") if sync_plan is not None else None
+                if planned and "content" in planned:
+                    lines = planned["content"].splitlines()
+                else:
+                    with open(tag_filepath, "r", encoding="utf-8") as f:
+                        # Lire les lignes ici pour éviter les problèmes avec readlines() + strip()
+                        lines = f.read().splitlines()
                 new_lines = []
                 # Garder une trace si on trouve des liens valides
                 has_valid_note_link = False
@@ -550,10 +1744,7 @@ def clean_tag_files():
                         ref = re.search(r"\[\[(.*?)\]\]", stripped)
                         if ref:
                             ref_filename = ref.group(1)
-                            path_to_check = os.path.join(OUTPUT_DIR, f"{ref_filename}.md")
-                            # print(f"Examining line: {stripped}") # Debug
-                            # print(f"Checking if file exists: {path_to_check}") # Debug
-                            if os.path.exists(path_to_check):
+                            if ref_filename in existing_files:
                                 new_lines.append(line) # Garder la ligne seulement si la note existe
                                 has_valid_note_link = True
                             # else:
@@ -587,45 +1778,321 @@ def clean_tag_files():
 
                     if is_effectively_empty:
                         try:
-                            os.remove(tag_filepath)
-                            print(f"Tag file {tag_filepath} deleted (no remaining links and effectively empty).")
+                            if sync_plan is not None:
+                                plan_operation(tag_filepath, "delete")
+                            else:
+                                os.remove(tag_filepath)
+                            count("files_deleted")
+                            existing_files.discard(tag_filename)
+                            file_hash_cache.pop(f"{tag_filename}.md", None)
+                            log(f"Tag file {tag_filepath} deleted (no remaining links and effectively empty).", 2)
                             # Important: Mettre à jour aussi l'ensemble pour l'index
                             if tag_filename in tag_notes_set:
                                 tag_notes_set.remove(tag_filename)
                         except OSError as e:
-                            print(f"Error deleting file {tag_filepath}: {e}")
-                    else:
+                            log(f"Error deleting file {tag_filepath}: {e}", 0)
+                    elif new_lines != lines:
                         # Le fichier n'a pas de liens mais a d'autre contenu texte. On le garde et on le réécrit.
-                        print(f"Tag file {tag_filepath} kept (no links, but other content).")
-                        with open(tag_filepath, "w", encoding="utf-8") as f:
-                            f.write("\n".join(new_lines) + "\n")
+                        log(f"Tag file {tag_filepath} kept (no links, but other content).", 2)
+                        write_generated_file(f"{tag_filename}.md", "\n".join(new_lines) + "\n")
 
-                else:
-                    # Le fichier a des liens valides (notes ou tags), on le réécrit avec les nettoyages potentiels
-                    print(f"Tag file {tag_filepath} cleaned/kept (has remaining links).")
-                    with open(tag_filepath, "w", encoding="utf-8") as f:
-                        f.write("\n".join(new_lines) + "\n")
+                elif new_lines != lines:
+                    # Le fichier a des liens valides (notes ou tags), on le réécrit avec les nettoyages
+                    log(f"Tag file {tag_filepath} cleaned (has remaining links).", 2)
+                    write_generated_file(f"{tag_filename}.md", "\n".join(new_lines) + "\n")
 
             except Exception as e:
-                print(f"Error cleaning tag file {tag_filepath}: {e}")
+                log(f"Error cleaning tag file {tag_filepath}: {e}", 0)
             # --- PAS DE CODE SUPPLÉMENTAIRE ICI ---
         #else: # Cas où le fichier tag listé dans tag_notes_set n'existe pas (ne devrait pas arriver)
             #print(f"Warning: Tag file {tag_filepath} listed in set but not found.")
 
 # === Fonction appelée par le bouton ===
 
-def sync_to_obsidian():
-    note_ids = get_note_ids()
+def run_sync():
+    """
+    Effectue la sync complète. Exécutée en arrière-plan par QueryOp : lectures de la
+    collection et écritures dans le coffre se font hors du thread Qt.
+    Retourne le message à afficher une fois terminé.
+    """
+    reset_sync_stats()
+    report_progress("Recherche des notes...")
+    with timed("query"):
+        note_ids = get_note_ids()
     if not note_ids:
-        showInfo("Aucune note trouvée selon la requête.")
-        return
+        return "Aucune note trouvée selon la requête."
     notes = get_notes_details(note_ids)
-    export_notes(notes)
-    # On convertit les IDs en chaînes pour la comparaison
-    current_ids = set(str(nid) for nid in note_ids)
-    clean_old_files(current_ids)
-    clean_tag_files()
-    showInfo("Export vers Obsidian terminé.")
+    if sync_plan is None:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+    load_id_index()
+    reset_tag_state()
+    resumed_ids = start_sync_journal(note_ids) if JOURNAL_PATH and sync_plan is None else set()
+    open_search_db()
+    finished = False
+    try:
+        export_notes(notes, total=len(note_ids), resumed_ids=resumed_ids)
+        # Le nettoyage n'a lieu qu'après un export complet : jamais de suppression d'après une sync interrompue
+        # On convertit les IDs en chaînes pour la comparaison
+        current_ids = set(str(nid) for nid in note_ids)
+        clean_old_files(current_ids)
+        clean_tag_files()
+        finished = True
+    finally:
+        # Même après une annulation, on garde la trace des notes déjà écrites
+        close_search_db()
+        save_id_index()
+        close_sync_journal(finished)
+        write_sync_report("sync" if sync_plan is None else "plan")
+    counters = sync_stats["counters"]
+    return (f"Export vers Obsidian terminé.\n"
+            f"{counters.get('files_written', 0)} fichier(s) écrit(s), "
+            f"{counters.get('files_skipped', 0)} inchangé(s).")
+
+def on_sync_finished(message):
+    global sync_running
+    sync_running = False
+    showInfo(message)
+
+def on_sync_failed(error):
+    global sync_running
+    sync_running = False
+    if isinstance(error, SyncCancelled):
+        showInfo("Export vers Obsidian annulé.")
+    else:
+        showInfo(f"Erreur lors de l'export vers Obsidian : {error}")
+
+def sync_to_obsidian():
+    """Lance la sync en arrière-plan, avec fenêtre de progression et annulation."""
+    global sync_running
+    if sync_running:
+        tooltip("Une sync vers Obsidian est déjà en cours.")
+        return
+    sync_running = True
+    op = QueryOp(parent=mw, op=lambda col: run_sync(), success=on_sync_finished)
+    op.failure(on_sync_failed).with_progress("Sync vers Obsidian...").run_in_background()
+
+# === Aperçu de la sync (plan sans écriture) ===
+
+def plan_sync():
+    """
+    Déroule la sync complète (requête, rendu, graphe des tags, nettoyage) sans toucher au coffre :
+    retourne le plan des créations, mises à jour, déplacements et suppressions, avec le contenu
+    à écrire et l'état final de l'index, prêt pour apply_sync_plan().
+    """
+    global sync_plan
+    sync_plan = {"operations": {}, "search": []}
+    try:
+        run_sync()
+        plan = sync_plan
+        plan["index"] = {"notes": dict(id_index), "files": dict(file_hash_cache), "media": dict(media_manifest)}
+    finally:
+        sync_plan = None
+    return plan
+
+def format_sync_plan(plan, max_lines=15):
+    """Résumé lisible du plan : nombre d'opérations par type et premiers fichiers concernés."""
+    by_op = {"create": [], "update": [], "rename": [], "delete": []}
+    for path, operation in sorted(plan["operations"].items()):
+        label = f"{operation['source']} -> {path}" if operation["op"] == "rename" else path
+        by_op[operation["op"]].append(label)
+    if not any(by_op.values()):
+        return "Aperçu : le coffre est déjà à jour, aucune écriture prévue."
+    titles = {"create": "Créations", "update": "Mises à jour", "rename": "Déplacements", "delete": "Suppressions"}
+    lines = ["Aperçu de la sync vers Obsidian :"]
+    for op, labels in by_op.items():
+        if labels:
+            lines.append(f"\n{titles[op]} : {len(labels)}")
+            lines.extend(f"  {label}" for label in labels[:max_lines])
+            if len(labels) > max_lines:
+                lines.append(f"  ... et {len(labels) - max_lines} autre(s)")
+    return "\n".join(lines)
+
+def apply_sync_plan(plan):
+    """
+    Applique un plan en une passe : déplacements, puis écritures (atomiques), puis suppressions,
+    et enfin l'index calculé lors de l'aperçu. À appliquer juste après l'aperçu : un fichier
+    modifié entre-temps dans le coffre serait écrasé.
+    """
+    global attachment_files
+    reset_sync_stats()
+    operations = plan["operations"]
+    touched = set()
+    with timed("write"):
+        for path, operation in operations.items():
+            if operation["op"] == "rename":
+                destination = os.path.join(OUTPUT_DIR, path)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                os.replace(os.path.join(OUTPUT_DIR, operation["source"]), destination)
+                remove_empty_folders(operation["source"])
+                count("files_moved")
+                touched.add(path)
+        for path, operation in operations.items():
+            filepath = os.path.join(OUTPUT_DIR, path)
+            if operation.get("media"):
+                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                link_or_copy(operation["media"], filepath)
+                count("media_written")
+            elif "content" in operation:
+                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                write_file_if_changed(filepath, operation["content"])
+                touched.add(path)
+        for path, operation in operations.items():
+            if operation["op"] == "delete":
+                try:
+                    os.remove(os.path.join(OUTPUT_DIR, path))
+                    remove_empty_folders(path)
+                    count("files_deleted")
+                except FileNotFoundError:
+                    pass
+
+    # Base de recherche, ouverte avant d'installer l'index de l'aperçu (qui a déjà tout rendu si elle manquait)
+    if plan.get("search"):
+        open_search_db()
+        for change in plan["search"]:
+            write_search_row(change)
+        close_search_db()
+
+    # Index de l'aperçu, avec les mtimes des fichiers qui viennent d'être écrits ou déplacés
+    id_index.clear()
+    id_index.update(plan["index"]["notes"])
+    file_hash_cache.clear()
+    file_hash_cache.update(plan["index"]["files"])
+    media_manifest.clear()
+    media_manifest.update(plan["index"]["media"])
+    attachment_files = None
+    for path, entry in list(id_index.items()) + list(file_hash_cache.items()):
+        relative_path = entry.get("path", path)
+        if relative_path in touched:
+            entry["mtime"] = os.path.getmtime(os.path.join(OUTPUT_DIR, relative_path))
+            entry["hash"] = hashlib.md5(operations[relative_path]["content"].encode("utf-8")).hexdigest() \
+                if "content" in operations[relative_path] else entry.get("hash")
+    save_id_index()
+    write_sync_report("apply")
+    counters = sync_stats["counters"]
+    return (f"Plan appliqué : {counters.get('files_written', 0)} fichier(s) écrit(s), "
+            f"{counters.get('files_moved', 0)} déplacé(s), {counters.get('files_deleted', 0)} supprimé(s).")
+
+def on_plan_ready(plan):
+    global sync_running
+    summary = format_sync_plan(plan)
+    if not plan["operations"]:
+        sync_running = False
+        showInfo(summary)
+        return
+    if not askUser(summary + "\n\nAppliquer ces changements maintenant ?"):
+        sync_running = False
+        return
+    op = QueryOp(parent=mw, op=lambda col: apply_sync_plan(plan), success=on_sync_finished)
+    op.failure(on_sync_failed).with_progress("Application du plan...").run_in_background()
+
+def preview_sync_to_obsidian():
+    """Calcule le plan de la sync en arrière-plan, l'affiche, et l'applique si l'utilisateur confirme."""
+    global sync_running
+    if sync_running:
+        tooltip("Une sync vers Obsidian est déjà en cours.")
+        return
+    sync_running = True
+    op = QueryOp(parent=mw, op=lambda col: plan_sync(), success=on_plan_ready)
+    op.failure(on_sync_failed).with_progress("Aperçu de la sync vers Obsidian...").run_in_background()
+
+# === Export en direct (hooks d'édition d'Anki) ===
+
+def run_live_export(changed_ids, deleted_ids):
+    """
+    Exporte uniquement les notes modifiées et supprime celles qui ont disparu (ou ne
+    correspondent plus à DECK_QUERY), puis réécrit seulement les fiches de tag concernées.
+    Le reste du graphe des tags est reconstitué depuis l'index, sans lire le coffre. Les tags
+    absents de l'index (index reconstruit par rebuild_id_index) sont d'abord chargés depuis Anki :
+    un graphe partiel réécrirait les fiches et Anki.md sans ces tags.
+    """
+    reset_sync_stats()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    load_id_index()
+    deleted_ids = deleted_ids | load_missing_index_tags()
+    reset_tag_state()
+    open_search_db()
+    matching = set()
+    if changed_ids:
+        matching = set(mw.col.findNotes(f"({DECK_QUERY}) nid:{','.join(str(nid) for nid in changed_ids)}"))
+    affected_tag_files = set()
+    try:
+        for nid in changed_ids | deleted_ids:
+            entry = id_index.get(str(nid))
+            if entry:
+                affected_tag_files.update(get_tag_filenames(entry.get("tags")))
+            if nid not in matching:
+                remove_exported_note(nid)
+        for key, entry in id_index.items():
+            if int(key) not in matching:
+                add_note_to_tag_graph(entry.get("tags"), note_stem(entry["path"]))
+        records = list(get_notes_details(sorted(matching)))
+        for record in records:
+            affected_tag_files.update(get_tag_filenames(record.tags))
+        export_notes(records, total=len(records), only_tag_files=affected_tag_files)
+    finally:
+        close_search_db()
+        save_id_index()
+        write_sync_report("live")
+    return len(matching), len(deleted_ids)
+
+def on_live_export_finished(result):
+    global sync_running, progress_enabled
+    sync_running = False
+    progress_enabled = True
+    log(f"Export en direct : {result[0]} note(s) exportée(s), {result[1]} supprimée(s).")
+
+def on_live_export_failed(error):
+    global sync_running, progress_enabled
+    sync_running = False
+    progress_enabled = True
+    log(f"Erreur lors de l'export en direct vers Obsidian : {error}", 0)
+
+def flush_live_export():
+    """Appelé par le minuteur : lance l'export en arrière-plan des notes en attente."""
+    global sync_running, progress_enabled
+    if not live_changed_ids and not live_deleted_ids:
+        return
+    if sync_running:
+        # Une sync est déjà en cours : on retente plus tard
+        live_timer.start(LIVE_EXPORT_DELAY_MS)
+        return
+    changed_ids = set(live_changed_ids)
+    deleted_ids = set(live_deleted_ids)
+    live_changed_ids.clear()
+    live_deleted_ids.clear()
+    sync_running = True
+    progress_enabled = False
+    op = QueryOp(parent=mw, op=lambda col: run_live_export(changed_ids, deleted_ids),
+                 success=on_live_export_finished)
+    op.failure(on_live_export_failed).run_in_background()
+
+def queue_live_export(note_ids, deleted=False):
+    """Ajoute des IDs à la file d'attente et relance le minuteur (toujours sur le thread principal)."""
+    def schedule():
+        target = live_deleted_ids if deleted else live_changed_ids
+        target.update(nid for nid in note_ids if nid)
+        live_timer.start(LIVE_EXPORT_DELAY_MS)
+    mw.taskman.run_on_main(schedule)
+
+def on_note_added(note):
+    queue_live_export([note.id])
+
+def on_note_will_flush(note):
+    queue_live_export([note.id])
+
+def on_notes_will_be_deleted(col, note_ids):
+    queue_live_export(list(note_ids), deleted=True)
+
+def setup_live_export():
+    """Branche l'export en direct sur les hooks d'ajout, de modification et de suppression de notes."""
+    global live_timer
+    live_timer = QTimer(mw)
+    live_timer.setSingleShot(True)
+    live_timer.timeout.connect(flush_live_export)
+    gui_hooks.add_cards_did_add_note.append(on_note_added)
+    hooks.note_will_flush.append(on_note_will_flush)
+    hooks.notes_will_be_deleted.append(on_notes_will_be_deleted)
+    log("Export en direct vers Obsidian activé.")
 
 # === Ajout du bouton dans le menu "Outils" ===
 
@@ -633,7 +2100,13 @@ def setup_menu():
     action = QAction("Sync vers Obsidian", mw)
     action.triggered.connect(sync_to_obsidian)
     mw.form.menuTools.addAction(action)
-    print("Bouton 'Sync vers Obsidian' ajouté au menu Outils.")
-
-# Initialisation de l'addon
-setup_menu()
+    preview_action = QAction("Aperçu de la sync vers Obsidian", mw)
+    preview_action.triggered.connect(preview_sync_to_obsidian)
+    mw.form.menuTools.addAction(preview_action)
+    log("Bouton 'Sync vers Obsidian' ajouté au menu Outils.")
+
+# Initialisation de l'addon (pas de fenêtre principale hors d'Anki : benchmark, tests)
+if mw is not None:
+    setup_menu()
+    if LIVE_EXPORT:
+        setup_live_export()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Banc d'essai des deux exporteurs sur des collections synthétiques, sans Anki.
+
+- Le pipeline de l'addon (__init__.py) tourne contre un faux `aqt`/`mw` dans un coffre temporaire.
+- export_anki_clozes.py tourne contre un faux serveur AnkiConnect local.
+
+Pour chaque taille de collection, le script mesure par phase le temps, les appels
+système sur les fichiers (open, stat, listdir, replace, remove) et le pic mémoire Python.
+
+Exemple :
+    python3 benchmark.py --sizes 1000,10000,100000 --json bench.json
+"""
+import argparse
+import builtins
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CLOZE_MODEL_ID = 1
+BASIC_MODEL_ID = 2
+MODELS = {
+    CLOZE_MODEL_ID: {"id": CLOZE_MODEL_ID, "name": "Texte à trou", "flds": [{"name": "Texte"}, {"name": "Verso extra"}]},
+    BASIC_MODEL_ID: {"id": BASIC_MODEL_ID, "name": "Basique", "flds": [{"name": "Recto"}, {"name": "Verso"}]},
+}
+
+# === Collection synthétique ===
+
+def make_tag_pool(depth, fanout):
+    """Tous les tags d'un arbre de profondeur `depth` et de largeur `fanout` (ex. T1::T1-2::T1-2-1)."""
+    pool, level = [], [""]
+    for _ in range(depth):
+        level = [f"{parent}::{parent.rsplit('::', 1)[-1] or 'T'}-{i}" if parent else f"T{i}"
+                 for parent in level for i in range(1, fanout + 1)]
+        pool.extend(level)
+    return pool
+
+def make_collection(size, cloze_ratio=0.7, tag_depth=3, tag_fanout=4, html_size=400, seed=0):
+    """Produit des lignes (id, mid, mod, tags, flds) comme celles de la table notes d'Anki."""
+    rnd = random.Random(seed)
+    tag_pool = make_tag_pool(tag_depth, tag_fanout)
+    filler = "<p>Lorem ipsum dolor sit amet, <b>consectetur</b> adipiscing elit.</p>"
+    rows = []
+    for i in range(size):
+        nid = 1_600_000_000_000 + i
+        tags = " ".join(rnd.sample(tag_pool, rnd.randint(0, 2)))
+        # Quelques titres en double et quelques notes sans titre pour exercer les collisions de noms
+        title = f"Notion {rnd.randint(0, size // 3)}" if rnd.random() < 0.9 else ""
+        body = filler * max(1, html_size // len(filler))
+        if rnd.random() < cloze_ratio:
+            text = f"<div>{title} {{{{c1::réponse {i}::indice}}}}</div>{body}&nbsp;fin"
+            rows.append((nid, CLOZE_MODEL_ID, 1, f" {tags} ", f"{text}\x1f"))
+        else:
+            rows.append((nid, BASIC_MODEL_ID, 1, f" {tags} ", f"{title}<br>Question {i}\x1f{body}"))
+    return rows
+
+# === Faux Anki (aqt, anki, mw) ===
+
+DECK_COUNT = 8
+
+class FakeDB:
+    """Répond aux requêtes de l'addon : notes (id in ..., toutes les colonnes ou id et tags) et cards (nid in ...)."""
+
+    def __init__(self, rows):
+        self.rows = {row[0]: row for row in rows}
+
+    def all(self, sql, *args):
+        ids = sql.split(" in ", 1)[1].split(")", 1)[0].strip(" (")
+        nids = [int(nid) for nid in ids.split(",") if nid and int(nid) in self.rows]
+        if " from cards " in sql:
+            # Une carte par note : (nid, did, odid), paquet déduit de l'ID
+            return [(nid, 1 + nid % DECK_COUNT, 0) for nid in nids]
+        if sql.startswith("select id, tags "):
+            return [(nid, self.rows[nid][3]) for nid in nids]
+        return [self.rows[nid] for nid in nids]
+
+    def execute(self, sql, *args):
+        return iter(self.all(sql, *args))
+
+class FakeCollection:
+    def __init__(self, rows, media_dir):
+        self.db = FakeDB(rows)
+        self.models = types.SimpleNamespace(get=MODELS.get)
+        self.media = types.SimpleNamespace(dir=lambda: media_dir)
+        self.decks = types.SimpleNamespace(name=lambda did: f"Fiches::Paquet {did}::Chapitre {did % 3}")
+
+    def findNotes(self, query):
+        # Seul le filtre "nid:1,2,3" de l'export en direct est interprété
+        if "nid:" in query:
+            nids = query.split("nid:", 1)[1].split()[0].rstrip(")").split(",")
+            return [int(nid) for nid in nids if int(nid) in self.db.rows]
+        return list(self.db.rows)
+
+    find_notes = findNotes
+
+class FakeQueryOp:
+    """Exécute l'opération immédiatement, sur le thread courant."""
+
+    def __init__(self, parent, op, success):
+        self._op, self._success, self._failure = op, success, None
+
+    def failure(self, callback):
+        self._failure = callback
+        return self
+
+    def with_progress(self, label=None):
+        return self
+
+    def run_in_background(self):
+        try:
+            result = self._op(None)
+        except Exception as e:
+            if self._failure is None:
+                raise
+            self._failure(e)
+        else:
+            self._success(result)
+
+class FakeHook(list):
+    pass
+
+def install_fake_anki():
+    """Enregistre dans sys.modules des modules aqt/anki minimaux suffisants pour charger l'addon."""
+    mw = types.SimpleNamespace(
+        col=None,
+        form=types.SimpleNamespace(menuTools=types.SimpleNamespace(addAction=lambda action: None)),
+        progress=types.SimpleNamespace(update=lambda **kwargs: None, want_cancel=lambda: False),
+        taskman=types.SimpleNamespace(run_on_main=lambda callback: callback()),
+    )
+
+    class QAction:
+        def __init__(self, *args):
+            self.triggered = types.SimpleNamespace(connect=lambda callback: None)
+
+        def setShortcut(self, shortcut):
+            pass
+
+    class QTimer:
+        def __init__(self, *args):
+            self.timeout = types.SimpleNamespace(connect=lambda callback: None)
+
+        def setSingleShot(self, single):
+            pass
+
+        def start(self, msec):
+            pass
+
+    modules = {
+        "aqt": types.ModuleType("aqt"),
+        "aqt.qt": types.ModuleType("aqt.qt"),
+        "aqt.utils": types.ModuleType("aqt.utils"),
+        "aqt.operations": types.ModuleType("aqt.operations"),
+        "anki": types.ModuleType("anki"),
+        "anki.hooks": types.ModuleType("anki.hooks"),
+        "anki.utils": types.ModuleType("anki.utils"),
+    }
+    modules["aqt"].mw = mw
+    modules["aqt"].gui_hooks = types.SimpleNamespace(add_cards_did_add_note=FakeHook())
+    modules["aqt.qt"].QAction = QAction
+    modules["aqt.qt"].QTimer = QTimer
+    modules["aqt.utils"].showInfo = lambda *args, **kwargs: None
+    modules["aqt.utils"].tooltip = lambda *args, **kwargs: None
+    modules["aqt.utils"].askUser = lambda *args, **kwargs: False
+    modules["aqt.operations"].QueryOp = FakeQueryOp
+    modules["anki"].hooks = modules["anki.hooks"]
+    modules["anki.hooks"].note_will_flush = FakeHook()
+    modules["anki.hooks"].notes_will_be_deleted = FakeHook()
+    modules["anki.utils"].ids2str = lambda ids: "(%s)" % ",".join(str(i) for i in ids)
+    sys.modules.update(modules)
+    return mw
+
+def load_addon(vault):
+    """
+    Charge __init__.py comme un module et redirige tous ses chemins vers le coffre temporaire
+    (et les données de l'add-on, USER_FILES_DIR, vers un dossier voisin du coffre).
+    """
+    spec = importlib.util.spec_from_file_location("anki_obsidian_addon", os.path.join(REPO_DIR, "__init__.py"))
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = addon
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(addon)
+    redirects = {addon.USER_FILES_DIR: vault + "_user_files", addon.OUTPUT_DIR: vault}
+    for name, value in list(vars(addon).items()):
+        if not (name.isupper() and isinstance(value, str)):
+            continue
+        for old_dir, new_dir in redirects.items():
+            if value.startswith(old_dir):
+                setattr(addon, name, new_dir + value[len(old_dir):])
+                break
+    return addon
+
+# === Mesures ===
+
+class SyscallCounter:
+    """Compte les appels open/stat/listdir/replace/remove pendant une phase."""
+
+    PATCHED = [(os, "stat"), (os, "listdir"), (os, "replace"), (os, "remove"), (os, "scandir")]
+
+    def __init__(self):
+        self.counts = {}
+
+    def _wrap(self, name, func):
+        def wrapper(*args, **kwargs):
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        self.saved = [(module, attr, getattr(module, attr)) for module, attr in self.PATCHED]
+        for module, attr, func in self.saved:
+            setattr(module, attr, self._wrap(attr, func))
+        self.saved_open = builtins.open
+
+        def counting_open(file, mode="r", *args, **kwargs):
+            key = "open_read" if set(mode) <= {"r", "b", "t"} else "open_write"
+            self.counts[key] = self.counts.get(key, 0) + 1
+            return self.saved_open(file, mode, *args, **kwargs)
+
+        builtins.open = counting_open
+        return self
+
+    def __exit__(self, *exc):
+        for module, attr, func in self.saved:
+            setattr(module, attr, func)
+        builtins.open = self.saved_open
+
+def measure(results, phase, func, with_memory):
+    """Exécute func() en mesurant le temps, les appels système et (optionnellement) le pic mémoire."""
+    if with_memory:
+        tracemalloc.start()
+    with SyscallCounter() as counter, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+    peak = None
+    if with_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    results.append({"phase": phase, "seconds": round(elapsed, 4), "syscalls": counter.counts,
+                    "peak_mib": round(peak / 2**20, 2) if peak is not None else None})
+    return result
+
+def count_vault_files(vault):
+    return sum(len(files) for _, _, files in os.walk(vault))
+
+def bench_addon(rows, with_memory, layout="flat", fts=False):
+    """Sync complète, sync sans changement, puis sync après modification de 1 % des notes."""
+    results = []
+    vault = tempfile.mkdtemp(prefix="bench_vault_")
+    try:
+        mw = install_fake_anki()
+        mw.col = FakeCollection(rows, os.path.join(vault, "..", "collection.media"))
+        addon = load_addon(vault)
+        addon.VAULT_LAYOUT = layout
+        if fts:
+            addon.FTS_DB_PATH = os.path.join(vault, ".anki_obsidian_search.sqlite")
+        measure(results, "full_sync", addon.run_sync, with_memory)
+        measure(results, "noop_sync", addon.run_sync, with_memory)
+        for nid in list(mw.col.db.rows)[::100]:
+            row = mw.col.db.rows[nid]
+            mw.col.db.rows[nid] = (row[0], row[1], row[2] + 1, row[3], row[4].replace("fin", "fin modifiée"))
+        measure(results, "sync_1pct_changed", addon.run_sync, with_memory)
+        results.append({"phase": "vault_files", "count": count_vault_files(vault)})
+    finally:
+        shutil.rmtree(vault, ignore_errors=True)
+    return results
+
+def make_ankiconnect_server(rows):
+    """Faux AnkiConnect : findNotes et notesInfo servis depuis la collection synthétique."""
+    rows_by_id = {row[0]: row for row in rows}
+
+    def note_info(row):
+        nid, mid, _, tags, flds = row
+        model = MODELS[mid]
+        values = flds.split("\x1f")
+        return {"noteId": nid, "modelName": model["name"], "tags": tags.split(),
+                "fields": {fld["name"]: {"value": values[i], "order": i} for i, fld in enumerate(model["flds"])}}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if request["action"] == "findNotes":
+                result = list(rows_by_id)
+            elif request["action"] == "notesInfo":
+                result = [note_info(rows_by_id[nid]) for nid in request["params"]["notes"] if nid in rows_by_id]
+            else:
+                result = None
+            body = json.dumps({"result": result, "error": None}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def bench_cli(rows, with_memory):
+    """export_anki_clozes.py contre le faux AnkiConnect."""
+    results = []
+    vault = tempfile.mkdtemp(prefix="bench_cli_vault_")
+    server = make_ankiconnect_server(rows)
+    try:
+        sys.path.insert(0, REPO_DIR)
+        import export_anki_clozes as cli
+        cli.ankiconnect_url = f"http://127.0.0.1:{server.server_port}"
+        cli.output_dir = vault
+        cli.index_note_path = os.path.join(vault, "Anki.md")
+        cli.tag_notes_set.clear()
+        measure(results, "cli_full_export", cli.main, with_memory)
+        results.append({"phase": "vault_files", "count": count_vault_files(vault)})
+    finally:
+        server.shutdown()
+        shutil.rmtree(vault, ignore_errors=True)
+    return results
+
+def print_results(title, results):
+    print(f"\n== {title} ==")
+    for result in results:
+        if "count" in result:
+            print(f"  {result['phase']:<20} {result['count']} fichier(s)")
+            continue
+        calls = ", ".join(f"{name}={count}" for name, count in sorted(result["syscalls"].items()))
+        memory = f"{result['peak_mib']:>8.2f} MiB" if result["peak_mib"] is not None else ""
+        print(f"  {result['phase']:<20} {result['seconds']:>9.3f} s {memory}  {calls}")
+
+def print_memory_summary(report):
+    """
+    Pic mémoire de chaque sync selon la taille de la collection. Le chargement et le rendu
+    travaillent par lots : seuls l'index des IDs et le graphe des tags grandissent avec la
+    collection, le coût par note doit donc rester à peu près constant.
+    """
+    print("\n== Pic mémoire par taille de collection ==")
+    for size, results in report.items():
+        for target, phases in results.items():
+            for result in phases:
+                if result.get("peak_mib") is None:
+                    continue
+                per_note = result["peak_mib"] * 2**20 / size
+                print(f"  {target:<6} {size:>8} notes  {result['phase']:<20} "
+                      f"{result['peak_mib']:>8.2f} MiB  {per_note:>8.0f} octets/note")
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai des exports Anki -> Obsidian.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="tailles de collection, séparées par des virgules")
+    parser.add_argument("--cloze-ratio", type=float, default=0.7, help="part de notes 'texte à trou'")
+    parser.add_argument("--tag-depth", type=int, default=3, help="profondeur de l'arbre des tags")
+    parser.add_argument("--tag-fanout", type=int, default=4, help="nombre d'enfants par tag")
+    parser.add_argument("--html-size", type=int, default=400, help="taille approximative du HTML de chaque note")
+    parser.add_argument("--no-memory", action="store_true", help="ne pas mesurer le pic mémoire (plus rapide)")
+    parser.add_argument("--layout", default="flat", choices=["flat", "deck", "tag", "hash"],
+                        help="VAULT_LAYOUT de l'addon")
+    parser.add_argument("--fts", action="store_true", help="active l'index de recherche FTS_DB_PATH de l'addon")
+    parser.add_argument("--skip-cli", action="store_true", help="ne pas mesurer export_anki_clozes.py")
+    parser.add_argument("--json", help="écrit aussi les résultats dans ce fichier JSON")
+    args = parser.parse_args()
+
+    report = {}
+    for size in (int(s) for s in args.sizes.split(",") if s):
+        rows = make_collection(size, args.cloze_ratio, args.tag_depth, args.tag_fanout, args.html_size)
+        report[size] = {"addon": bench_addon(rows, not args.no_memory, args.layout, args.fts)}
+        print_results(f"addon, {size} notes", report[size]["addon"])
+        if not args.skip_cli:
+            report[size]["cli"] = bench_cli(rows, not args.no_memory)
+            print_results(f"export_anki_clozes.py, {size} notes", report[size]["cli"])
+
+    if not args.no_memory:
+        print_memory_summary(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -4,24 +4,54 @@ import os
 import re
 import html
 import hashlib
-from bs4 import BeautifulSoup  # Toujours utile pour extraire la 1ère ligne
+import time
+import functools
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from requests.adapters import HTTPAdapter
 
 # === Configuration ===
 output_dir = os.path.expanduser("~/Downloads/Documents perso/Obsidian")
 index_note_path = os.path.join(output_dir, "Anki.md")
+index_page_max_entries = 500   # Au-delà, Anki.md renvoie vers des pages par lettre (0 : une seule page)
+index_pages_subdir = "Index Anki"  # Sous-dossier du coffre pour ces pages
 
 anki_field_name = "Texte"      # Nom du champ Anki contenant le HTML principal (pour les cartes 'texte à trou')
 title_max_length = 95          # Longueur max pour le titre extrait
+title_cache_size = 4096        # Nombre de titres mémorisés
+cloze_render_mode = "plain"    # Occlusions : "plain" (texte seul), "highlight" (<mark>texte</mark>) ou "footnote" (texte<sup>c1</sup>)
 
 # Pour cibler le deck dont le titre contient "Fiches"
 deck_query = "deck:*Fiches*"
 
+# Client AnkiConnect
+ankiconnect_url = "http://localhost:8765"
+notes_info_batch_size = 500    # Nombre d'IDs envoyés par requête notesInfo
+notes_info_workers = 4         # Nombre de requêtes notesInfo envoyées en parallèle
+request_timeout = 30           # Timeout (en secondes) de chaque requête
+max_retries = 3                # Nombre de tentatives pour un lot avant de l'abandonner
+
 # Mettre ici l'ID d'une note à tester, ou None pour tout exporter
 note_id_target = None         # Mettre un ID ici pour tester une seule note spécifique
 
 # Ensemble pour stocker les noms des fiches de tag (pour l'index global)
 tag_notes_set = set()
 
+# Compteurs des écritures effectives / évitées (contenu identique)
+write_stats = {"written": 0, "skipped": 0}
+
+# Nom de fichier attribué à chaque note (d'après le commentaire anki_id en première ligne),
+# noms déjà pris (en minuscules), prochain suffixe par nom de base, et anciens exports sans ID
+anki_id_pattern = re.compile(r"<!--\s*anki_id:\s*(\d+)\s*-->")
+# Fin d'une note exportée avant l'ajout de l'ID : corps, "---", puis la ligne "Tags:" (absente sans tag)
+legacy_export_end_pattern = re.compile(r"\n\n---(\n\nTags: [^\n]*)?$")
+exported_filenames = {}
+taken_filenames = set()
+filename_counters = {}
+legacy_filenames = set()
+
 # Définition des types de notes traitées en mode "recto verso"
 recto_verso_types = {
     "basique (carte inversée optionnelle)",
@@ -32,9 +62,98 @@ recto_verso_types = {
 
 # === Fonctions ===
 
+cloze_token_pattern = re.compile(r"\{\{c(\d+)::|::|\}\}|\u00A0")
+
+def render_clozes(text, mode="plain"):
+    """
+    Parcourt le texte une seule fois pour retirer les occlusions Anki, y compris imbriquées
+    ({{c1::a {{c2::b}} c}}) et avec indice ({{c1::réponse::indice}}), et remplace les espaces
+    insécables par des espaces. mode : "plain" (contenu seul), "highlight" (<mark>contenu</mark>)
+    ou "footnote" (contenu<sup>cN</sup>, avec les indices dans une liste <dl> à la fin) ; seules
+    les occlusions les plus externes sont décorées. Les champs restent du HTML brut, où Obsidian
+    n'interprète pas le Markdown (==...==, [^1]) : la décoration est donc en HTML. Une occlusion non fermée est laissée telle quelle.
+    """
+    # Pile des occlusions ouvertes : [numéro, morceaux du contenu, morceaux de l'indice ou None]
+    stack = []
+    out = []
+    footnotes = {}
+    pos = 0
+
+    def current():
+        """Morceaux en cours d'écriture : texte hors occlusion, contenu ou indice de l'occlusion ouverte."""
+        if not stack:
+            return out
+        return stack[-1][2] if stack[-1][2] is not None else stack[-1][1]
+
+    for match in cloze_token_pattern.finditer(text):
+        target = current()
+        target.append(text[pos:match.start()])
+        pos = match.end()
+        token = match.group()
+        if token == "\u00A0":
+            target.append(" ")
+        elif match.group(1):
+            stack.append([match.group(1), [], None])
+        elif not stack:
+            target.append(token)
+        elif token == "::":
+            if stack[-1][2] is None:
+                stack[-1][2] = []
+            else:
+                target.append(token)
+        else:
+            number, content, hint = stack.pop()
+            content = "".join(content)
+            # Seule l'occlusion la plus externe est décorée (pas de surlignage imbriqué)
+            if not stack and mode == "highlight":
+                content = f"<mark>{content}</mark>"
+            elif not stack and mode == "footnote":
+                hints = footnotes.setdefault(number, [])
+                if hint and "".join(hint) not in hints:
+                    hints.append("".join(hint))
+                content = f"{content}<sup>c{number}</sup>"
+            current().append(content)
+    current().append(text[pos:])
+
+    # Occlusions jamais fermées : on restitue le texte d'origine, de la plus interne à la plus externe
+    while stack:
+        number, content, hint = stack.pop()
+        literal = "{{c" + number + "::" + "".join(content) + ("::" + "".join(hint) if hint is not None else "")
+        current().append(literal)
+
+    result = "".join(out)
+    if footnotes:
+        definitions = [f"<dt>c{n}</dt><dd>" + (" / ".join(footnotes[n]) or f"c{n}") + "</dd>"
+                       for n in sorted(footnotes, key=int)]
+        result += "\n\n<dl>" + "".join(definitions) + "</dl>"
+    return result
+
 def remove_cloze_keep_html(text):
-    """Supprime les marqueurs d'occlusion Anki {{c...}} en gardant le contenu."""
-    return re.sub(r"{{c\d+::(.*?)(::.*?)?}}", r"\1", text, flags=re.DOTALL)
+    """Supprime les marqueurs d'occlusion Anki {{c...}} en gardant le contenu, et remplace les &nbsp; par des espaces."""
+    return render_clozes(text)
+
+def write_file_if_changed(filepath, content):
+    """
+    Écrit content dans filepath seulement s'il diffère du contenu actuel, via un fichier
+    temporaire renommé (jamais de fichier tronqué). Retourne True si le fichier a été écrit.
+    """
+    if os.path.exists(filepath):
+        with open(filepath, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                write_stats["skipped"] += 1
+                return False
+    directory, filename = os.path.split(filepath)
+    tmp_path = os.path.join(directory, f".{filename}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    write_stats["written"] += 1
+    return True
 
 def sanitize_filename(title, max_length=100):
     """Nettoie une chaîne pour l'utiliser comme nom de fichier."""
@@ -46,34 +165,115 @@ def sanitize_filename(title, max_length=100):
         return "Sans titre"
     return title[:max_length].strip()
 
+class TitleFound(Exception):
+    """Interrompt FirstTextLineParser dès que la première ligne de texte est trouvée."""
+
+class FirstTextLineParser(HTMLParser):
+    """
+    Parcourt le HTML en flux et s'arrête au premier nœud texte non vide, sans construire d'arbre.
+    Comme BeautifulSoup.get_text(), ignore commentaires, <script>, <style> et <template>,
+    et fusionne le texte contigu (entités comprises) en un seul nœud.
+    """
+    SKIPPED_TAGS = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.skip_depth = 0
+        self.pending = []
+        self.first_line = None
+
+    def flush(self):
+        text = "".join(self.pending).strip()
+        self.pending = []
+        if text:
+            self.first_line = text.split("\n", 1)[0].strip()
+            raise TitleFound()
+
+    def handle_starttag(self, tag, attrs):
+        self.flush()
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth += 1
+
+    def handle_endtag(self, tag):
+        self.flush()
+        if tag in self.SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.flush()
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.pending.append(data)
+
+    def handle_comment(self, data):
+        self.flush()
+
+    def handle_decl(self, decl):
+        self.flush()
+
+    def handle_pi(self, data):
+        self.flush()
+
+    def unknown_decl(self, data):
+        self.flush()
+        if data.upper().startswith("CDATA["):
+            self.pending.append(data[len("CDATA["):])
+            self.flush()
+
+    def close(self):
+        super().close()
+        self.flush()
+
+@functools.lru_cache(maxsize=title_cache_size)
 def extract_title_from_html(html_content, max_len):
     """
     Extrait la première ligne de texte significative du HTML pour servir de titre.
-    Tronque si nécessaire.
+    Tronque si nécessaire. Le résultat est mémorisé par contenu.
     """
     if not html_content:
         return "Sans titre"
+    parser = FirstTextLineParser()
     try:
-        soup = BeautifulSoup(html_content, 'lxml')
-        text_content = soup.get_text(separator='\n', strip=True)
-        if not text_content:
-            return "Sans titre"
-        first_line = ""
-        for line in text_content.split('\n'):
-            stripped_line = line.strip()
-            if stripped_line:
-                first_line = stripped_line
-                break
-        if not first_line:
-            return "Sans titre"
-        first_line = html.unescape(first_line)
-        if len(first_line) > max_len:
-            return first_line[:max_len] + "..."
-        else:
-            return first_line
+        parser.feed(html_content)
+        parser.close()
+    except TitleFound:
+        pass
     except Exception as e:
         print(f"⚠️ Erreur lors de l'extraction du titre : {e}. Utilisation de 'Sans titre'.")
         return "Sans titre"
+    if not parser.first_line:
+        return "Sans titre"
+    first_line = html.unescape(parser.first_line)
+    if len(first_line) > max_len:
+        return first_line[:max_len] + "..."
+    else:
+        return first_line
+
+class AnkiConnectError(Exception):
+    """Erreur renvoyée par AnkiConnect dans le champ "error" de sa réponse."""
+
+_session = None
+
+def get_session():
+    """Session HTTP persistante (keep-alive), avec un pool de connexions pour les requêtes parallèles."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(notes_info_workers, 1))
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+def invoke(action, timeout=None, **params):
+    """Appelle une action AnkiConnect et retourne son résultat."""
+    payload = {"action": action, "version": 6, "params": params}
+    r = get_session().post(ankiconnect_url, json=payload, timeout=timeout or request_timeout)
+    r.raise_for_status()
+    response = r.json()
+    if response.get("error"):
+        raise AnkiConnectError(response["error"])
+    return response.get("result", [])
 
 def get_note_ids():
     """Récupère les IDs des notes depuis AnkiConnect pour les decks dont le titre contient 'Fiches'."""
@@ -81,59 +281,131 @@ def get_note_ids():
         print(f"ℹ️ Ciblage de la note unique ID : {note_id_target}")
         return [note_id_target]
     print(f"🔍 Recherche de toutes les notes avec le deck correspondant à '{deck_query}'...")
-    payload = {
-        "action": "findNotes",
-        "version": 6,
-        "params": { "query": deck_query }
-    }
     try:
-        r = requests.post("http://localhost:8765", json=payload, timeout=10)
-        r.raise_for_status()
-        result = r.json().get("result", [])
+        result = invoke("findNotes", timeout=10, query=deck_query)
         print(f"🧠 {len(result)} IDs de notes trouvés pour la requête '{deck_query}'.")
         return result
     except requests.exceptions.ConnectionError:
-        print("❌ Erreur : Impossible de se connecter à AnkiConnect sur http://localhost:8765.")
+        print(f"❌ Erreur : Impossible de se connecter à AnkiConnect sur {ankiconnect_url}.")
         print("   Vérifiez qu'Anki est lancé et que l'extension AnkiConnect est installée et activée.")
         return None
     except requests.exceptions.Timeout:
         print("❌ Erreur : Timeout lors de la connexion à AnkiConnect.")
         return None
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, AnkiConnectError) as e:
         print(f"❌ Erreur de requête AnkiConnect (findNotes) : {e}")
         return None
     except Exception as e:
         print(f"❌ Erreur inattendue lors de la récupération des IDs : {e}")
         return None
 
-def get_notes_details(note_ids):
-    """Récupère les informations détaillées des notes spécifiées."""
+def fetch_notes_batch(batch):
+    """Récupère un lot de notes via notesInfo, avec plusieurs tentatives espacées en cas d'échec."""
+    for attempt in range(1, max_retries + 1):
+        try:
+            return invoke("notesInfo", notes=batch)
+        except (requests.exceptions.RequestException, AnkiConnectError, ValueError) as e:
+            if attempt == max_retries:
+                raise
+            print(f"⚠️ Lot de {len(batch)} notes en échec ({e}), nouvelle tentative {attempt + 1}/{max_retries}...")
+            time.sleep(0.5 * 2 ** (attempt - 1))
+
+def iter_notes_details(note_ids):
+    """
+    Produit les détails des notes au fil de l'eau : les IDs sont découpés en lots,
+    plusieurs lots sont demandés en parallèle, et chaque lot est rendu dès son arrivée
+    (dans l'ordre des IDs) pour que l'export commence sans attendre la fin du téléchargement.
+    """
     if not note_ids:
-        return []
-    print(f"ℹ️ Récupération des détails pour {len(note_ids)} notes...")
-    payload = {
-        "action": "notesInfo",
-        "version": 6,
-        "params": { "notes": note_ids }
-    }
-    try:
-        r = requests.post("http://localhost:8765", json=payload, timeout=30)
-        r.raise_for_status()
-        result = r.json().get("result", [])
-        print(f"✅ Détails récupérés pour {len(result)} notes.")
-        return result
-    except requests.exceptions.ConnectionError:
-        print("❌ Erreur : Impossible de se connecter à AnkiConnect sur http://localhost:8765.")
-        return None
-    except requests.exceptions.Timeout:
-        print("❌ Erreur : Timeout lors de la récupération des détails des notes.")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Erreur de requête AnkiConnect (notesInfo) : {e}")
-        return None
-    except Exception as e:
-        print(f"❌ Erreur inattendue lors de la récupération des détails des notes : {e}")
-        return None
+        return
+    batches = [note_ids[i:i + notes_info_batch_size] for i in range(0, len(note_ids), notes_info_batch_size)]
+    print(f"ℹ️ Récupération des détails pour {len(note_ids)} notes ({len(batches)} lot(s))...")
+    received = failed = 0
+    with ThreadPoolExecutor(max_workers=max(notes_info_workers, 1)) as pool:
+        # Au plus deux lots d'avance par worker : la mémoire reste bornée quelle que soit la taille du deck
+        remaining = iter(batches)
+        pending = deque()
+        for batch in remaining:
+            pending.append((batch, pool.submit(fetch_notes_batch, batch)))
+            if len(pending) >= 2 * max(notes_info_workers, 1):
+                break
+        while pending:
+            batch, future = pending.popleft()
+            next_batch = next(remaining, None)
+            if next_batch is not None:
+                pending.append((next_batch, pool.submit(fetch_notes_batch, next_batch)))
+            try:
+                notes = future.result()
+            except (requests.exceptions.RequestException, AnkiConnectError, ValueError) as e:
+                print(f"❌ Lot de {len(batch)} notes abandonné après {max_retries} tentative(s) : {e}")
+                failed += len(batch)
+                continue
+            received += len(notes)
+            yield from notes
+    print(f"✅ Détails récupérés pour {received} notes" + (f" ({failed} en échec)." if failed else "."))
+
+def scan_exported_notes():
+    """
+    Parcourt une seule fois le dossier de sortie en lisant seulement la première ligne de chaque
+    note, pour retrouver le fichier de chaque note déjà exportée et les noms déjà pris.
+    Les notes exportées avant l'ajout de l'ID peuvent être reprises, mais seulement si tout leur
+    contenu a la forme d'un export (is_legacy_export) : une note personnelle n'est jamais écrasée.
+    """
+    exported_filenames.clear()
+    taken_filenames.clear()
+    filename_counters.clear()
+    legacy_filenames.clear()
+    if not os.path.isdir(output_dir):
+        return
+    for entry in os.scandir(output_dir):
+        taken_filenames.add(entry.name.lower())
+        if not entry.name.endswith(".md") or not entry.is_file():
+            continue
+        try:
+            with open(entry.path, encoding="utf-8") as f:
+                first_line = f.readline()
+                match = anki_id_pattern.match(first_line.strip())
+                # Le reste du fichier n'est lu que pour les rares fichiers sans ID
+                legacy = not match and is_legacy_export(first_line + f.read())
+        except (OSError, UnicodeDecodeError):
+            continue
+        if match:
+            exported_filenames[int(match.group(1))] = entry.name[:-3]
+        elif legacy:
+            legacy_filenames.add(entry.name.lower())
+
+def is_legacy_export(content):
+    """
+    Vrai si content a la forme d'une note exportée sans ID : ni titre "# ..." ni en-tête YAML
+    en première ligne, et se termine par "---" suivi de la ligne "Tags:".
+    """
+    if content.startswith(("# ", "---")):
+        return False
+    return legacy_export_end_pattern.search(content.rstrip("\n")) is not None
+
+def allocate_filename(note_id, base_filename):
+    """
+    Retourne le nom de fichier de la note : celui déjà utilisé pour cet ID, sinon le premier nom
+    libre (base, base_1... ou "Sans titre 1", "Sans titre 2"...). Le compteur par nom de base
+    évite de retester les suffixes déjà attribués.
+    """
+    if note_id in exported_filenames:
+        return exported_filenames[note_id]
+    key = base_filename.lower()
+    if f"{key}.md" not in taken_filenames or f"{key}.md" in legacy_filenames:
+        # Nom libre, ou ancien export sans ID de la même note : on le reprend
+        legacy_filenames.discard(f"{key}.md")
+        filename_final = base_filename
+    else:
+        separator = " " if base_filename == "Sans titre" else "_"
+        suffix = filename_counters.get(key, 1)
+        while f"{key}{separator}{suffix}.md" in taken_filenames:
+            suffix += 1
+        filename_counters[key] = suffix + 1
+        filename_final = f"{base_filename}{separator}{suffix}"
+    taken_filenames.add(f"{filename_final}.md".lower())
+    exported_filenames[note_id] = filename_final
+    return filename_final
 
 def update_tag_file(tag_name, note_link):
     """
@@ -156,6 +428,8 @@ def update_tag_file(tag_name, note_link):
             lines.pop()
         if lines and lines[-1].strip() == tag_hashtag:
             lines.pop()
+            while lines and lines[-1].strip() == "":
+                lines.pop()
     else:
         lines = [f"# {tag_clean}", "", "Liste des notes liées:"]
 
@@ -167,8 +441,7 @@ def update_tag_file(tag_name, note_link):
     lines.append(tag_hashtag)
 
     new_content = "\n".join(lines) + "\n"
-    with open(tag_filepath, "w", encoding="utf-8") as f:
-        f.write(new_content)
+    write_file_if_changed(tag_filepath, new_content)
 
 def export_notes(notes):
     """Exporte les notes Anki en fichiers Markdown et met à jour les fiches de tag.
@@ -187,6 +460,7 @@ def export_notes(notes):
         return
 
     os.makedirs(output_dir, exist_ok=True)
+    scan_exported_notes()
     seen_hashes = set()
     exported_count = 0
 
@@ -219,6 +493,8 @@ def export_notes(notes):
                 continue
             html_body_no_cloze = remove_cloze_keep_html(raw_html_original)
             title = extract_title_from_html(html_body_no_cloze, title_max_length)
+            if cloze_render_mode != "plain":
+                html_body_no_cloze = render_clozes(raw_html_original, cloze_render_mode)
             content_to_write = f"{html_body_no_cloze}\n\n---\n\n{tags_md_line}".strip()
         elif model_lower in recto_verso_types:
             fields = note.get("fields", {})
@@ -243,29 +519,20 @@ def export_notes(notes):
             print(f"ℹ️ Note {note_id} ignorée car son type de carte ({model_name}) n'est pas supporté.")
             continue
 
-        content_hash = hashlib.md5((content_to_write + str(note_id)).encode("utf-8")).hexdigest()
+        content_hash = hashlib.md5((content_to_write + str(note_id)).encode("utf-8")).digest()
         if content_hash in seen_hashes:
             print(f"ℹ️ Note {note_id} déjà traitée (hash identique), ignorée.")
             continue
         seen_hashes.add(content_hash)
 
-        base_filename = sanitize_filename(title)
-        filename_final = base_filename
-        suffix = 1
-        while os.path.exists(os.path.join(output_dir, f"{filename_final}.md")):
-            if base_filename.startswith("Sans titre"):
-                match = re.match(r"^(Sans titre)(?: (\d+))?$", base_filename)
-                current_num = int(match.group(2) or 0) if match else 0
-                filename_final = f"Sans titre {current_num + suffix}"
-            else:
-                filename_final = f"{base_filename}_{suffix}"
-            suffix += 1
+        # L'ID caché en première ligne permet de retrouver le fichier de la note à la prochaine exportation
+        content_to_write = f"<!-- anki_id: {note_id} -->\n{content_to_write}"
+        filename_final = allocate_filename(note_id, sanitize_filename(title))
 
         filepath = os.path.join(output_dir, f"{filename_final}.md")
 
         try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(content_to_write)
+            write_file_if_changed(filepath, content_to_write)
             print(f"✅ Note {note_id} exportée : {filepath}")
             exported_count += 1
         except OSError as e:
@@ -279,20 +546,71 @@ def export_notes(notes):
             update_tag_file(tag, filename_final)
 
     print(f"\n✨ Exportation terminée. {exported_count} note(s) écrite(s).")
+    print(f"💾 {write_stats['written']} fichier(s) écrit(s), {write_stats['skipped']} inchangé(s).")
 
     if tag_notes_set:
+        tag_notes = sorted(tag_notes_set)
+        paginated = index_page_max_entries and len(tag_notes) > index_page_max_entries
+        pages = paginate_index(tag_notes) if paginated else {}
         index_lines = ["# 📘 Index des fiches de tag", "", "- [[Index]]", ""]
-        for tag_note in sorted(tag_notes_set):
-            index_lines.append(f"- [[{tag_note}]]")
+        for entry in (pages or tag_notes):
+            index_lines.append(f"- [[{entry}]]")
         try:
-            with open(index_note_path, "w", encoding="utf-8") as f:
-                f.write("\n".join(index_lines))
-            print(f"📎 Fichier d'index créé/mis à jour : {index_note_path}")
+            if write_file_if_changed(index_note_path, "\n".join(index_lines)):
+                print(f"📎 Fichier d'index créé/mis à jour : {index_note_path}")
+            write_index_pages(pages)
         except OSError as e:
             print(f"❌ Erreur lors de l'écriture du fichier d'index {index_note_path} : {e}")
     else:
         print("ℹ️ Aucune fiche de tag à indexer.")
 
+# === Pages d'index ===
+
+def index_page_key(tag_note):
+    """Lettre de la page d'index d'une fiche : initiale sans accent, "0-9" ou "Autres"."""
+    for char in unicodedata.normalize("NFKD", tag_note):
+        if char.isalpha() and char.isascii():
+            return char.upper()
+        if char.isdigit():
+            return "0-9"
+        if char.isalnum():
+            return "Autres"
+    return "Autres"
+
+def paginate_index(tag_notes):
+    """Répartit les fiches triées en pages par lettre, découpées au-delà de index_page_max_entries."""
+    index_name = os.path.splitext(os.path.basename(index_note_path))[0]
+    groups = {}
+    for tag_note in tag_notes:
+        groups.setdefault(index_page_key(tag_note), []).append(tag_note)
+    pages = {}
+    for key in sorted(groups):
+        entries = groups[key]
+        for part, i in enumerate(range(0, len(entries), index_page_max_entries), start=1):
+            page_name = f"{index_name} - {key}" if part == 1 else f"{index_name} - {key} {part}"
+            pages[page_name] = entries[i:i + index_page_max_entries]
+    return pages
+
+def write_index_pages(pages):
+    """Écrit les pages d'index qui ont changé et supprime celles qui ne sont plus produites."""
+    index_name = os.path.splitext(os.path.basename(index_note_path))[0]
+    pages_dir = os.path.join(output_dir, index_pages_subdir)
+    if pages:
+        os.makedirs(pages_dir, exist_ok=True)
+    written = 0
+    for page_name, entries in pages.items():
+        lines = [f"# {page_name}", "", f"[[{index_name}]]", ""]
+        lines.extend(f"- [[{tag_note}]]" for tag_note in entries)
+        if write_file_if_changed(os.path.join(pages_dir, f"{page_name}.md"), "\n".join(lines) + "\n"):
+            written += 1
+    existing = os.listdir(pages_dir) if os.path.isdir(pages_dir) else []
+    for filename in existing:
+        if filename.startswith(f"{index_name} - ") and filename.endswith(".md") and filename[:-3] not in pages:
+            os.remove(os.path.join(pages_dir, filename))
+            print(f"🗑️ Page d'index supprimée : {filename}")
+    if pages:
+        print(f"📎 Pages d'index : {written} écrite(s) sur {len(pages)}.")
+
 def main():
     """Fonction principale du script."""
     print("--- Début du script d'exportation Anki vers Obsidian (HTML brut) ---")
@@ -306,12 +624,8 @@ def main():
         print("ℹ️ Aucune note trouvée ou sélectionnée. Fin du script.")
         return
 
-    notes_data = get_notes_details(note_ids)
-    if notes_data is None:
-        print("❌ Arrêt du script en raison d'une erreur de récupération des détails des notes.")
-        return
-
-    export_notes(notes_data)
+    # Les notes sont exportées au fur et à mesure de l'arrivée des lots
+    export_notes(iter_notes_details(note_ids))
     print("--- Fin du script ---")
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Export sans interface : lit directement collection.anki2 (en lecture seule) avec sqlite3
+et alimente le même pipeline d'export que export_anki_clozes.py, sans Anki ni AnkiConnect.
+
+Seul un sous-ensemble de la syntaxe de recherche d'Anki est pris en charge :
+  deck:Nom   deck:*Fiches*   tag:Histoire   tag:Sciences::*   -deck:...   -tag:...
+Les termes sont combinés par ET, comme dans Anki. Anki doit être fermé pendant l'export.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import re
+import shlex
+import sqlite3
+from pathlib import Path
+
+import export_anki_clozes
+
+# === Configuration ===
+collection_path = os.path.expanduser("~/.local/share/Anki2/Utilisateur 1/collection.anki2")
+deck_query = export_anki_clozes.deck_query
+
+# === Lecture de la collection ===
+
+def open_collection(path):
+    """
+    Ouvre la collection en lecture seule. Anki doit être fermé : il ouvre la collection en
+    accès exclusif (locking_mode=exclusive) et la lecture échouerait avec "database is locked".
+    """
+    uri = Path(path).resolve().as_uri() + "?mode=ro"
+    # Un verrou posé par Anki n'est pas relâché avant sa fermeture : inutile d'attendre 5 s
+    return sqlite3.connect(uri, uri=True, timeout=1)
+
+def load_decks(conn):
+    """Retourne {id: nom complet} en gérant les deux formats de collection (table decks ou JSON)."""
+    try:
+        rows = conn.execute("select id, name from decks").fetchall()
+        # Les versions récentes séparent les niveaux par \x1f au lieu de "::"
+        return {did: name.replace("\x1f", "::") for did, name in rows}
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise  # Collection verrouillée, par exemple : pas un ancien schéma
+        decks = json.loads(conn.execute("select decks from col").fetchone()[0])
+        return {int(did): deck["name"] for did, deck in decks.items()}
+
+def load_notetypes(conn):
+    """Retourne {mid: (nom, [noms des champs])} en gérant les deux formats de collection."""
+    try:
+        notetypes = {mid: (name, []) for mid, name in conn.execute("select id, name from notetypes")}
+        for ntid, name in conn.execute("select ntid, name from fields order by ntid, ord"):
+            if ntid in notetypes:
+                notetypes[ntid][1].append(name)
+        return notetypes
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise
+        models = json.loads(conn.execute("select models from col").fetchone()[0])
+        return {
+            int(mid): (model["name"], [fld["name"] for fld in sorted(model["flds"], key=lambda f: f["ord"])])
+            for mid, model in models.items()
+        }
+
+# === Traduction de la requête en SQL ===
+
+def glob_to_like(pattern):
+    """Convertit un motif Anki (* = n'importe quoi) en motif LIKE échappé avec '\\'."""
+    pattern = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return pattern.replace("*", "%")
+
+def matching_deck_ids(decks, pattern):
+    """IDs des decks dont le nom correspond au motif, ainsi que de tous leurs sous-decks."""
+    regex = re.compile(fnmatch.translate(pattern.lower()))
+    matched = {name.lower() for name in decks.values() if regex.match(name.lower())}
+    return [
+        did for did, name in decks.items()
+        if name.lower() in matched or any(name.lower().startswith(m + "::") for m in matched)
+    ]
+
+def build_where_clause(query, decks):
+    """
+    Traduit les termes deck:/tag: de la requête en clause WHERE sur la table notes (alias n).
+    Lève ValueError pour tout terme non pris en charge.
+    """
+    clauses, params = [], []
+    for term in shlex.split(query):
+        negate = term.startswith("-")
+        if negate:
+            term = term[1:]
+        key, _, value = term.partition(":")
+        key = key.lower()
+        if key == "deck" and value:
+            ids = ",".join(str(did) for did in matching_deck_ids(decks, value)) or "0"
+            clause = f"n.id in (select nid from cards where did in ({ids}) or odid in ({ids}))"
+        elif key == "tag" and value:
+            # Les tags sont stockés sous la forme " tag1 tag2 " ; tag:X couvre aussi X::enfant
+            like = glob_to_like(value)
+            clause = "(n.tags like ? escape '\\' or n.tags like ? escape '\\')"
+            params.extend([f"% {like} %", f"% {like}::%"])
+        else:
+            raise ValueError(f"terme de recherche non pris en charge : {term}")
+        clauses.append(f"not {clause}" if negate else clause)
+    return " and ".join(clauses) or "1", params
+
+def iter_notes(conn, query):
+    """Produit les notes au format de notesInfo (AnkiConnect), une par une."""
+    decks = load_decks(conn)
+    notetypes = load_notetypes(conn)
+    where, params = build_where_clause(query, decks)
+    cursor = conn.execute(f"select n.id, n.mid, n.tags, n.flds from notes n where {where} order by n.id", params)
+    for nid, mid, tags, flds in cursor:
+        model_name, field_names = notetypes.get(mid, ("", []))
+        values = flds.split("\x1f")
+        yield {
+            "noteId": nid,
+            "modelName": model_name,
+            "tags": tags.split(),
+            "fields": {
+                name: {"value": values[order] if order < len(values) else "", "order": order}
+                for order, name in enumerate(field_names)
+            },
+        }
+
+def main():
+    """Fonction principale du script."""
+    parser = argparse.ArgumentParser(description="Export Anki -> Obsidian depuis collection.anki2, sans Anki.")
+    parser.add_argument("--collection", default=collection_path, help="chemin vers collection.anki2")
+    parser.add_argument("--query", default=deck_query, help="requête (deck:/tag: uniquement)")
+    parser.add_argument("--output", default=export_anki_clozes.output_dir, help="dossier du coffre Obsidian")
+    args = parser.parse_args()
+
+    print("--- Début de l'exportation Anki vers Obsidian (lecture directe de la collection) ---")
+    if not os.path.exists(args.collection):
+        print(f"❌ Collection introuvable : {args.collection}")
+        return
+
+    export_anki_clozes.output_dir = args.output
+    export_anki_clozes.index_note_path = os.path.join(args.output, "Anki.md")
+
+    conn = open_collection(args.collection)
+    try:
+        notes = iter_notes(conn, args.query)
+        export_anki_clozes.export_notes(notes)
+    except ValueError as e:
+        print(f"❌ Requête non prise en charge : {e}")
+    except sqlite3.DatabaseError as e:
+        if "locked" in str(e):
+            print("❌ Collection verrouillée : fermer Anki avant l'export (il garde la collection en accès exclusif).")
+        else:
+            print(f"❌ Erreur de lecture de la collection : {e}")
+    finally:
+        conn.close()
+    print("--- Fin du script ---")
+
+if __name__ == "__main__":
+    main()
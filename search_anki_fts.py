@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Recherche plein texte dans les notes exportées, sans Anki : interroge la base SQLite FTS5
+alimentée par l'add-on quand FTS_DB_PATH est configuré.
+
+Syntaxe FTS5 : mots (ET implicite), "expression exacte", préfixe*, OR, NOT,
+colonnes title:, text:, tags:, deck:  (ex. tags:Histoire revolution*)
+Les accents sont ignorés : "evenement" trouve "événement".
+"""
+import argparse
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import export_anki_clozes
+
+# === Configuration ===
+search_db_path = os.path.join(export_anki_clozes.output_dir, ".anki_obsidian_search.sqlite")
+result_limit = 20
+
+# === Recherche ===
+
+def open_search_db(path):
+    """Ouvre la base en lecture seule (une sync peut être en cours)."""
+    uri = Path(path).resolve().as_uri() + "?mode=ro"
+    return sqlite3.connect(uri, uri=True)
+
+def search(conn, query, limit):
+    """Retourne [(id, titre, chemin, extrait)] triés par pertinence (bm25, titre pondéré)."""
+    return conn.execute(
+        "select rowid, title, path, snippet(notes, 1, '**', '**', '…', 12) "
+        "from notes where notes match ? order by bm25(notes, 5.0, 1.0, 2.0, 1.0) limit ?",
+        (query, limit),
+    ).fetchall()
+
+def main():
+    """Fonction principale du script."""
+    parser = argparse.ArgumentParser(description="Recherche plein texte dans les notes Anki exportées vers Obsidian.")
+    parser.add_argument("query", help="requête FTS5")
+    parser.add_argument("--db", default=search_db_path, help="chemin vers la base de recherche")
+    parser.add_argument("--limit", type=int, default=result_limit, help="nombre maximal de résultats")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Base de recherche introuvable : {args.db} (configurer FTS_DB_PATH puis lancer une sync)")
+        return
+
+    conn = open_search_db(args.db)
+    try:
+        start = time.perf_counter()
+        results = search(conn, args.query, args.limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    except sqlite3.OperationalError as e:
+        print(f"❌ Requête invalide : {e}")
+        return
+    finally:
+        conn.close()
+
+    for nid, title, path, extract in results:
+        print(f"📝 {title}  [{nid}]")
+        print(f"   {path}")
+        print(f"   {extract}")
+    print(f"🔎 {len(results)} résultat(s) en {elapsed_ms:.1f} ms")
+
+if __name__ == "__main__":
+    main()
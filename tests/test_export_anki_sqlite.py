@@ -0,0 +1,102 @@
+"""export_anki_sqlite.py sur de petites collections construites pour le test (deux formats de schéma)."""
+import json
+import sqlite3
+import sys
+
+import pytest
+
+import export_anki_sqlite
+
+DECKS = {1: "Fiches", 2: "Fiches::Histoire", 3: "Autre", 4: "Mes Fiches perso"}
+NOTES = [
+    # (id, mid, tags, champs, paquet)
+    (101, 10, " Histoire ", ["Q1", "R1"], 1),
+    (102, 10, " Histoire::Moderne Sciences ", ["Q2", "R2"], 2),
+    (103, 20, " Sciences ", ["{{c1::texte}}"], 3),
+    (104, 20, "", ["sans tag"], 4),
+    (105, 10, " Historique ", ["Q5"], 3),
+]
+
+def create_collection(path, legacy):
+    """Collection minimale : schéma récent (tables decks, notetypes, fields) ou ancien (JSON dans col)."""
+    conn = sqlite3.connect(path)
+    conn.execute("create table notes (id integer primary key, mid integer, tags text, flds text)")
+    conn.execute("create table cards (id integer primary key, nid integer, did integer, odid integer)")
+    if legacy:
+        models = {"10": {"name": "Basique", "flds": [{"name": "Verso", "ord": 1}, {"name": "Recto", "ord": 0}]},
+                  "20": {"name": "Texte à trou", "flds": [{"name": "Texte", "ord": 0}]}}
+        decks = {str(did): {"name": name} for did, name in DECKS.items()}
+        conn.execute("create table col (models text, decks text)")
+        conn.execute("insert into col values (?, ?)", (json.dumps(models), json.dumps(decks)))
+    else:
+        conn.execute("create table decks (id integer primary key, name text)")
+        conn.executemany("insert into decks values (?, ?)",
+                         [(did, name.replace("::", "\x1f")) for did, name in DECKS.items()])
+        conn.execute("create table notetypes (id integer primary key, name text)")
+        conn.executemany("insert into notetypes values (?, ?)", [(10, "Basique"), (20, "Texte à trou")])
+        conn.execute("create table fields (ntid integer, ord integer, name text)")
+        conn.executemany("insert into fields values (?, ?, ?)",
+                         [(10, 1, "Verso"), (10, 0, "Recto"), (20, 0, "Texte")])
+    for nid, mid, tags, fields, did in NOTES:
+        conn.execute("insert into notes values (?, ?, ?, ?)", (nid, mid, tags, "\x1f".join(fields)))
+        conn.execute("insert into cards values (?, ?, ?, 0)", (nid * 10, nid, did))
+    conn.commit()
+    conn.close()
+
+@pytest.fixture(params=[False, True], ids=["schema-recent", "schema-ancien"])
+def collection(request, tmp_path):
+    path = tmp_path / "collection.anki2"
+    create_collection(path, legacy=request.param)
+    conn = export_anki_sqlite.open_collection(path)
+    yield conn
+    conn.close()
+
+def note_ids(conn, query):
+    return [note["noteId"] for note in export_anki_sqlite.iter_notes(conn, query)]
+
+@pytest.mark.parametrize("query, expected", [
+    ("", [101, 102, 103, 104, 105]),
+    ("deck:Fiches", [101, 102]),              # Sous-decks compris
+    ("deck:*Fiches*", [101, 102, 104]),
+    ("deck:fiches::histoire", [102]),
+    ("-deck:Fiches", [103, 104, 105]),
+    ("tag:Histoire", [101, 102]),             # Tag et enfants, pas Historique
+    ("tag:Hist*", [101, 102, 105]),
+    ("tag:Sciences -deck:Autre", [102]),
+    ('"deck:Mes Fiches perso"', [104]),
+])
+def test_query(collection, query, expected):
+    assert note_ids(collection, query) == expected
+
+def test_notes_info_format(collection):
+    note = next(export_anki_sqlite.iter_notes(collection, "tag:Histoire::Moderne"))
+    assert note == {
+        "noteId": 102,
+        "modelName": "Basique",
+        "tags": ["Histoire::Moderne", "Sciences"],
+        "fields": {"Recto": {"value": "Q2", "order": 0}, "Verso": {"value": "R2", "order": 1}},
+    }
+
+def test_missing_field_is_empty(collection):
+    note = next(export_anki_sqlite.iter_notes(collection, "tag:Historique"))
+    assert note["fields"]["Verso"] == {"value": "", "order": 1}
+
+def test_unsupported_term(collection):
+    with pytest.raises(ValueError):
+        note_ids(collection, "is:due")
+
+def test_collection_locked_by_anki(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "collection.anki2"
+    create_collection(path, legacy=False)
+    anki = sqlite3.connect(path)
+    anki.execute("pragma locking_mode = exclusive")
+    anki.execute("pragma journal_mode = wal")
+    anki.execute("update notes set tags = tags")
+    anki.commit()
+    monkeypatch.setattr(sys, "argv", ["export_anki_sqlite.py", "--collection", str(path),
+                                      "--output", str(tmp_path / "vault")])
+    try:
+        export_anki_sqlite.main()
+    finally:
+        anki.close()
+    assert "fermer Anki" in capsys.readouterr().out
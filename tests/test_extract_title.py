@@ -0,0 +1,51 @@
+"""extract_title_from_html (analyseur en flux) comparé à l'ancienne version à base de BeautifulSoup."""
+import html
+import random
+
+import pytest
+
+from export_anki_clozes import extract_title_from_html
+
+bs4 = pytest.importorskip("bs4")
+
+def old_extract_title_from_html(html_content, max_len):
+    """Ancienne version : tout le texte via BeautifulSoup, puis la première ligne non vide."""
+    if not html_content:
+        return "Sans titre"
+    text_content = bs4.BeautifulSoup(html_content, "html.parser").get_text(separator="\n", strip=True)
+    for line in text_content.split("\n"):
+        stripped_line = line.strip()
+        if stripped_line:
+            title = html.unescape(stripped_line)
+            return title if len(title) <= max_len else title[:max_len] + "..."
+    return "Sans titre"
+
+CORPUS = [
+    "", "   ", "<div></div>", "plain", "<div>  Hello <b>world</b></div>", "<br>line1<br>line2",
+    "&nbsp;&nbsp;x", "a &amp; b", "&amp;lt;x&amp;gt;", "<script>var a=1</script>Real",
+    "<style>p{}</style><p>Styled</p>", "<!-- c -->after", "<![CDATA[cdata]]>x", "a < b", "x<y",
+    "<p>multi\nline\ntext</p>", "\n\n  <span>   </span> t ", "<template>tpl</template>Vis", "<img src='a.png'>", "<b>Bo</b>ld", "Fo&#39;o", "&#x41;B", "<div>" + "x" * 200 + "</div>",
+    "<p>é à ç</p>", "<ruby>漢<rt>kan</rt></ruby>", "1 &lt 2", "<a href='x'>link</a> tail",
+    "<?xml version='1.0'?>t", "<!DOCTYPE html>doc", "&amp;nbsp;", "<p>&#160;</p>ok", "  nb",
+    "<div>\r\nwin\r\n</div>",
+]
+
+PIECES = ["<div>", "</div>", "<b>", "</b>", "<br>", " ", "\n", "&nbsp;", "&amp;", "txt", "é", "<!--c-->",
+          "<script>s</script>", "<", ">", "&lt;", "<span class='a'>", "</span>", " ", "{{c1::", "}}",
+          "&#39;", "&"]
+
+def random_corpus(count, seed=1):
+    rnd = random.Random(seed)
+    return ["".join(rnd.choice(PIECES) for _ in range(rnd.randint(0, 12))) for _ in range(count)]
+
+@pytest.mark.parametrize("max_len", [95, 5])
+def test_same_titles_as_beautifulsoup(max_len):
+    for fragment in CORPUS + random_corpus(5000):
+        assert extract_title_from_html(fragment, max_len) == old_extract_title_from_html(fragment, max_len), fragment
+
+@pytest.mark.parametrize("fragment, expected", [
+    ("&nbsp", "Sans titre"),         # BeautifulSoup donnait une espace insécable comme titre
+    ("&unknown; z", "&unknown; z"),  # Selon la version, BeautifulSoup retire ou garde le ";"
+])
+def test_malformed_entities(fragment, expected):
+    assert extract_title_from_html(fragment, 95) == expected
@@ -0,0 +1,35 @@
+"""Export en direct (run_live_export) sur un index sans tags, reconstruit par rebuild_id_index."""
+import os
+
+from test_sync_plan import edit, load, quiet, snapshot
+
+import benchmark
+
+def test_live_export_completes_missing_tags_without_full_sync(tmp_path):
+    rows = benchmark.make_collection(40, seed=5)
+    real, real_col = load(str(tmp_path / "real"), list(rows))
+    live, live_col = load(str(tmp_path / "live"), list(rows))
+    quiet(real.run_sync)
+    quiet(live.run_sync)
+
+    # Index perdu, puis une note vidée (ignorée au rendu, donc jamais réenregistrée dans l'index)
+    # et une note supprimée, inconnues de l'index reconstruit
+    os.remove(live.ID_INDEX_PATH)
+    nids = sorted(live_col.db.rows)
+    for col in (real_col, live_col):
+        row = col.db.rows[nids[2]]
+        col.db.rows[nids[2]] = (row[0], row[1], 99, row[3], "\x1f")
+        del col.db.rows[nids[8]]
+
+    for changed in (nids[3], nids[4]):
+        for col in (real_col, live_col):
+            edit(col, changed, 99)
+        quiet(real.run_sync)
+        quiet(live.run_live_export, {changed}, set())
+        counters = live.sync_stats["counters"]
+        # Seule la note modifiée est traitée : pas de sync complète en repli
+        assert counters["notes_exported"] + counters["notes_unchanged"] == 1
+        assert all("tags" in entry for entry in live.id_index.values())
+        assert str(nids[8]) not in live.id_index
+        path = live.id_index[str(changed)]["path"]
+        assert snapshot(live.OUTPUT_DIR)[path] == snapshot(real.OUTPUT_DIR)[path]
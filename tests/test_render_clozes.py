@@ -0,0 +1,50 @@
+"""render_clozes (copie de export_anki_clozes.py, identique à celle de l'add-on)."""
+import random
+import re
+
+import pytest
+
+from export_anki_clozes import render_clozes
+
+def old_remove_cloze_keep_html(text):
+    """Ancienne version à base de regex, correcte pour des occlusions ni imbriquées ni mal formées."""
+    text = text.replace(" ", " ")
+    return re.sub(r"{{c\d+::(.*?)(::.*?)?}}", r"\1", text, flags=re.DOTALL)
+
+def random_fragment(rnd):
+    """Fragment HTML avec des occlusions bien formées (avec ou sans indice) et des espaces insécables."""
+    words = ["le", "la", "réponse", "<b>gras</b>", "<div>", "</div>", " ", "&nbsp;", "a:b", "x\ny", "{c1}"]
+    parts = []
+    for _ in range(rnd.randint(0, 12)):
+        if rnd.random() < 0.3:
+            content = " ".join(rnd.choice(words) for _ in range(rnd.randint(0, 3)))
+            hint = "::" + rnd.choice(words) if rnd.random() < 0.4 else ""
+            parts.append(f"{{{{c{rnd.randint(1, 12)}::{content}{hint}}}}}")
+        else:
+            parts.append(rnd.choice(words))
+    return rnd.choice(["", " "]).join(parts)
+
+def test_matches_old_regex_on_well_formed_input():
+    rnd = random.Random(0)
+    for _ in range(5000):
+        fragment = random_fragment(rnd)
+        assert render_clozes(fragment) == old_remove_cloze_keep_html(fragment), fragment
+
+@pytest.mark.parametrize("text, expected", [
+    ("{{c1::a {{c2::b}} c}}", "a b c"),
+    ("{{c1::réponse::indice}} et {{c2::x}}", "réponse et x"),
+    ("{{c1::a {{c2::b::h}} c::indice}}", "a b c"),
+    ("début {{c1::non fermée", "début {{c1::non fermée"),
+    ("a::b }} c", "a::b }} c"),
+])
+def test_nested_hints_and_malformed(text, expected):
+    assert render_clozes(text) == expected
+
+def test_highlight_decorates_outermost_only():
+    assert render_clozes("<div>{{c1::a {{c2::b}}}} {{c3::c}}</div>", "highlight") == \
+        "<div><mark>a b</mark> <mark>c</mark></div>"
+
+def test_footnote_collects_hints_per_number():
+    result = render_clozes("{{c2::x::h1}} {{c1::y}} {{c2::z::h2}}", "footnote")
+    assert result == ("x<sup>c2</sup> y<sup>c1</sup> z<sup>c2</sup>\n\n"
+                      "<dl><dt>c1</dt><dd>c1</dd><dt>c2</dt><dd>h1 / h2</dd></dl>")
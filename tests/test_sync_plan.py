@@ -0,0 +1,119 @@
+"""Aperçu + application du plan (plan_sync, apply_sync_plan) comparés à une vraie sync, avec le faux Anki de benchmark.py."""
+import contextlib
+import io
+import os
+
+import pytest
+
+import benchmark
+
+def load(vault, rows):
+    """Charge une instance de l'addon sur son propre coffre et sa propre collection."""
+    mw = benchmark.install_fake_anki()
+    mw.col = benchmark.FakeCollection(rows, os.path.join(vault, "collection.media"))
+    os.makedirs(vault, exist_ok=True)
+    return benchmark.load_addon(vault), mw.col
+
+def quiet(func, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+def snapshot(vault):
+    """Contenu de tous les fichiers visibles du coffre (hors fichiers cachés de l'addon)."""
+    files = {}
+    for root, _, filenames in os.walk(vault):
+        for filename in filenames:
+            if not filename.startswith("."):
+                path = os.path.join(root, filename)
+                with open(path, "rb") as f:
+                    files[os.path.relpath(path, vault)] = f.read()
+    return files
+
+def edit(col, nid, mod):
+    row = col.db.rows[nid]
+    col.db.rows[nid] = (row[0], row[1], mod, row[3], row[4].replace("fin", "fin modifiée", 1))
+
+@pytest.fixture
+def vaults(tmp_path):
+    rows = benchmark.make_collection(60, seed=3)
+    real, real_col = load(str(tmp_path / "real"), list(rows))
+    planned, planned_col = load(str(tmp_path / "planned"), list(rows))
+    return real, real_col, planned, planned_col
+
+def preview_and_apply(addon):
+    before = snapshot(addon.OUTPUT_DIR)
+    plan = quiet(addon.plan_sync)
+    assert snapshot(addon.OUTPUT_DIR) == before, "l'aperçu a écrit dans le coffre"
+    quiet(addon.apply_sync_plan, plan)
+    return plan
+
+@pytest.mark.parametrize("layout", ["flat", "hash"])
+def test_preview_then_apply_matches_real_sync(vaults, layout):
+    real, real_col, planned, planned_col = vaults
+    for addon in (real, planned):
+        addon.VAULT_LAYOUT = layout
+
+    quiet(real.run_sync)
+    preview_and_apply(planned)
+    assert snapshot(planned.OUTPUT_DIR) == snapshot(real.OUTPUT_DIR)
+
+    # Une note modifiée, une supprimée, puis un changement de rangement
+    nids = sorted(real_col.db.rows)
+    for col in (real_col, planned_col):
+        edit(col, nids[5], 99)
+        del col.db.rows[nids[7]]
+    quiet(real.run_sync)
+    preview_and_apply(planned)
+    assert snapshot(planned.OUTPUT_DIR) == snapshot(real.OUTPUT_DIR)
+
+    for addon in (real, planned):
+        addon.VAULT_LAYOUT = "flat" if layout == "hash" else "hash"
+    quiet(real.run_sync)
+    preview_and_apply(planned)
+    assert snapshot(planned.OUTPUT_DIR) == snapshot(real.OUTPUT_DIR)
+    assert quiet(planned.plan_sync)["operations"] == {}
+
+def test_sync_after_apply_is_a_no_op(vaults):
+    _, _, planned, _ = vaults
+    quiet(planned.run_sync)
+    # Nouveau rendu de toutes les notes, mais la plupart des fichiers ne changent pas
+    planned.RENAME_ON_TITLE_CHANGE = True
+    preview_and_apply(planned)
+    assert all(entry["mtime"] is not None for entry in planned.id_index.values())
+
+    def mtimes():
+        # Tous les fichiers du coffre, cachés compris : rapport et journal sont rangés hors du coffre
+        return {os.path.join(root, filename): os.path.getmtime(os.path.join(root, filename))
+                for root, _, filenames in os.walk(planned.OUTPUT_DIR) for filename in filenames}
+
+    before = mtimes()
+    quiet(planned.run_sync)
+    counters = planned.sync_stats["counters"]
+    assert mtimes() == before
+    # Notes sautées d'après l'index (mod et mtime), sans relire leurs fichiers
+    assert counters["notes_unchanged"] == len(planned.id_index)
+    assert "render" not in planned.sync_stats["timers"]
+
+def search_rows(addon):
+    import sqlite3
+    with contextlib.closing(sqlite3.connect(addon.FTS_DB_PATH)) as conn:
+        return conn.execute("select rowid, title, text, tags, deck, path from notes order by rowid").fetchall()
+
+def test_preview_then_apply_updates_search_index(vaults, tmp_path):
+    real, real_col, planned, planned_col = vaults
+    real.FTS_DB_PATH = str(tmp_path / "real.sqlite")
+    planned.FTS_DB_PATH = str(tmp_path / "planned.sqlite")
+
+    quiet(real.run_sync)
+    preview_and_apply(planned)
+    assert search_rows(planned) == search_rows(real) != []
+
+    nids = sorted(real_col.db.rows)
+    for col in (real_col, planned_col):
+        edit(col, nids[2], 99)
+        del col.db.rows[nids[4]]
+    quiet(real.run_sync)
+    preview_and_apply(planned)
+    quiet(planned.run_sync)
+    assert search_rows(planned) == search_rows(real)
+    assert nids[4] not in {row[0] for row in search_rows(planned)}